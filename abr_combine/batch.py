@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from abr_combine.pipeline import process_sample
+from abr_combine.phenotypes import read_phenotypes, db_version
+from abr_combine.util import transl_orgn_resfinder
+from abr_combine.cache import default_cache_size
+from abr_combine.fasta import fasta_extensions, default_fast_tmp, sample_name, strip_compression
+from abr_combine.genenames import gene_names
+from abr_combine.registry import registry
+from abr_combine.metrics import Metrics
+from abr_combine.intermediate import intermediate_ext
+
+# state shared by all samples of a batch, set once per worker process
+_batch_state = {}
+
+
+#### internal functions ####
+
+def read_samplesheet(sheet, species=""):
+    """
+    reads a tab-separated sample sheet with columns: sample, fasta[, species].
+    lines starting with "#" are ignored, relative paths are resolved relative to the sheet
+    """
+    samples = []
+    sheet_dir = os.path.dirname(os.path.abspath(sheet))
+    with open(sheet, "r") as inf_h:
+        for fields in csv.reader(inf_h, delimiter="\t"):
+            if not fields or not fields[0].strip() or fields[0].startswith("#"):
+                continue
+            if len(fields) < 2:
+                sys.stderr.write(f"Skipping sample sheet line without fasta: {fields[0]}\n")
+                continue
+            fasta = os.path.join(sheet_dir, fields[1].strip())
+            sample_species = fields[2].strip() if len(fields) > 2 and fields[2].strip() else species
+            samples.append((fields[0].strip(), fasta, sample_species))
+    return samples
+
+
+def read_fasta_dir(directory, species=""):
+    samples = []
+    for filename in sorted(os.listdir(directory)):
+        name = strip_compression(filename)
+        if name.endswith(".tar") or any(name.endswith(ext) for ext in fasta_extensions):
+            samples.append((sample_name(filename), os.path.join(directory, filename), species))
+    return samples
+
+
+def _init_worker(state):
+    _batch_state.update(state)
+    if state.get("names_file"):
+        gene_names.load(state["names_file"])
+    if state.get("registry_file"):
+        registry.load(state["registry_file"])
+
+
+def _sample_phenotypes(species):
+    """
+    phenotype table of the species, read once per worker if it was not prepared by the main process
+    """
+    phenotypes = _batch_state.setdefault("phenotypes", {})
+    pointfinder_species = transl_orgn_resfinder("", species)
+    if pointfinder_species not in phenotypes:
+        phenotypes[pointfinder_species] = read_phenotypes(species, db_version(_batch_state["version_df"]))
+    return phenotypes[pointfinder_species]
+
+
+def _run_batch_sample(sample, fasta, species, options):
+    state = _batch_state
+    outputs = {}
+    for key, ext in [("outtable", ""), ("excelfile", ".xlsx"), ("specfile", ".spec"), ("jsonfile", ".json")]:
+        if options.get(key):
+            outputs[key] = os.path.join(options[key], sample + ext)
+    if options.get("ndjsonfile"):
+        outputs["ndjsonfile"] = options["ndjsonfile"]
+
+    if options.get("intermediate"):
+        outputs["intermediate"] = os.path.join(options["intermediate"], sample + intermediate_ext)
+
+    sys.stdout.write(f"Processing sample {sample}: {fasta}\n")
+    metrics = Metrics()
+    exit_code = process_sample(fasta, species, state["methods"], {}, _sample_phenotypes(species), state["version_df"],
+                          options["tmpdir"], options["threads"], options["timeout"], label=options.get("label") or sample,
+                          cachedir=options.get("cachedir"), cache_size=options.get("cache_size", default_cache_size),
+                          fast_tmp=options.get("fast_tmp", default_fast_tmp), metrics=metrics, sample=sample, store=options.get("store"),
+                          shards=options.get("shards", 1), prescreen=options.get("prescreen"), prescreen_index=options.get("prescreen_index"), **outputs)
+    if state.get("names_file"):
+        gene_names.save(state["names_file"])
+    if options.get("metrics") and options.get("outtable"):
+        metrics.write_json(os.path.join(options["outtable"], sample + ".metrics.json"), sample=sample, species=species, exit_code=exit_code)
+    return exit_code, metrics.to_dict()
+
+
+#### functions that might be called from outside ####
+
+def collect_samples(path, species=""):
+    """
+    path is either a directory of (gzipped) fasta files or a sample sheet
+    return: list of (sample, fasta, species)
+    """
+    if os.path.isdir(path):
+        return read_fasta_dir(path, species)
+    return read_samplesheet(path, species)
+
+
+def submit_sample(executor, sample, fasta, species, options):
+    """
+    queues one sample on a pool of start_pool. options as for run_batch, output directories have to exist
+    return: concurrent.futures.Future of (exit code, Metrics.to_dict())
+    """
+    return executor.submit(_run_batch_sample, sample, fasta, species, options)
+
+
+def read_all_phenotypes(species_list, version_df):
+    """
+    return: dict pointfinder species (None for species without PointFinder database) -> phenotype table
+    """
+    phenotypes = {}
+    for species in species_list:
+        pointfinder_species = transl_orgn_resfinder("", species)
+        if pointfinder_species not in phenotypes:
+            phenotypes[pointfinder_species] = read_phenotypes(species, db_version(version_df))
+    return phenotypes
+
+
+def start_pool(methods, version_df, options, workers=1, species_list=[]):
+    """
+    starts worker processes for samples submitted with submit_sample. the phenotype tables of species_list are read once and
+    shared with all workers, tables of other species are read by the workers on first use
+    """
+    state = {"methods": methods, "version_df": version_df, "phenotypes": read_all_phenotypes(species_list, version_df),
+             "names_file": options.get("names_file"), "registry_file": options.get("registry_file")}
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,))
+
+
+def run_batch(samples, methods, version_df, options, workers=1, metrics=None):
+    """
+    processes samples with a pool of worker processes. tool detection, versions and phenotype tables
+    are prepared once and shared with all workers.
+    options: dict with tmpdir, fast_tmp, threads (per sample), timeout, label, cachedir, cache_size, names_file, registry_file, store, metrics (write
+    <sample>.metrics.json next to the tables), ndjsonfile (one line per sample) and the output directories outtable, excelfile, specfile, jsonfile, intermediate
+    metrics: optional dict that is filled with sample -> Metrics.to_dict() of each processed sample
+    return: dict sample -> exit code
+    """
+    for key in ["outtable", "excelfile", "specfile", "jsonfile", "intermediate"]:
+        if options.get(key):
+            os.makedirs(options[key], exist_ok=True)
+
+    exit_codes = {}
+    with start_pool(methods, version_df, options, workers, [species for sample, fasta, species in samples]) as executor:
+        futures = {submit_sample(executor, sample, fasta, species, options): sample for sample, fasta, species in samples}
+        for future in as_completed(futures):
+            sample = futures[future]
+            try:
+                exit_codes[sample], sample_metrics = future.result()
+                if metrics is not None:
+                    metrics[sample] = sample_metrics
+            except Exception as e:
+                sys.stderr.write(f"Sample {sample} failed: {e}\n")
+                exit_codes[sample] = 1
+            if exit_codes[sample] != 0:
+                sys.stderr.write(f"Sample {sample} finished without result\n")
+
+    return exit_codes
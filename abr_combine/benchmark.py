@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import argparse
+import json
+import platform
+import subprocess
+import time
+import threading
+import tracemalloc
+from concurrent.futures import Future
+from datetime import datetime
+from tempfile import TemporaryDirectory
+import numpy as np
+import pandas as pd
+
+from abr_combine.transform import read_amr, read_table, read_pointfinder, combine_tables, merge_pairwise, view_by_antibiotic, view_by_genes, color_table
+from abr_combine.predict import predict_consensus, stack_views, predict_consensus_batch
+from abr_combine.fixtures import write_fixtures, write_pointfinder, write_pointfinder_results, write_pointfinder_json
+
+default_sizes = [10, 1000, 100000]
+default_samples = [1, 100, 10000]
+default_mutations = [100, 10000, 1000000]
+default_point_genes = 100
+
+# input of the shard check, sharded tool tables have to be identical to the tables of a run on the complete input
+default_shard_input = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "testdata", "ecoli.fasta.gz")
+
+# PointFinder output formats read by read_pointfinder
+pointfinder_writers = {"table": ("PointFinder_table.txt", write_pointfinder),
+                       "results": ("PointFinder_results.txt", write_pointfinder_results),
+                       "json": ("std_format_under_development.json", write_pointfinder_json)}
+
+# modules whose import time is measured by the startup benchmark, run_tools is the command line entry
+startup_modules = ["run_tools", "abr_combine.service", "abr_combine.version", "abr_combine.rescore", "abr_combine.pipeline", "combine_reports"]
+
+# dependencies that should only be loaded by the stages that need them
+heavy_modules = ["pandas", "numpy", "git", "openpyxl", "xlsxwriter", "styleframe"]
+
+
+#### internal functions ####
+
+def best_time(func, repeat, *args):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def peak_memory(func, *args):
+    """
+    peak of memory allocated by python during func (bytes)
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def parse_importtime(stderr):
+    """
+    parses the output of python -X importtime
+    return: dict module -> (self microseconds, cumulative microseconds, nesting level)
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), level)
+    return times
+
+
+def fixture_paths(directory):
+    """
+    recorded tool outputs in the layout of write_fixtures: NCBIAMRFinder.tsv, CARD-RGI.txt, ResFinder/ and optionally phenotypes.txt
+    """
+    paths = {"NCBIAMRFinder": os.path.join(directory, "NCBIAMRFinder.tsv"),
+             "CARD-RGI": os.path.join(directory, "CARD-RGI.txt"),
+             "ResFinder": os.path.join(directory, "ResFinder"),
+             "phenotype": os.path.join(directory, "phenotypes.txt")}
+    return {k: v for k, v in paths.items() if os.path.exists(v)}
+
+
+def read_pheno(paths, species=""):
+    if paths.get("phenotype"):
+        df_pheno = read_table(paths["phenotype"], "phenotype", "\t", ",", "Phenotype", "Gene_accession no.", report=["Class"])
+        df_pheno.drop_duplicates("mo", inplace=True)
+        return df_pheno
+    from abr_combine.phenotypes import read_phenotypes
+    return read_phenotypes(species)
+
+
+def merge_pheno(df, df_pheno):
+    df = df.merge(df_pheno, on="mo", how="left", suffixes=["_o",""])
+    df.drop("phenotype", axis=1, inplace=True)
+    return df
+
+
+def merged_table(paths, species=""):
+    """
+    merged df as built by the pipeline from tool outputs (paths: dict tool -> output, phenotype -> phenotypes.txt)
+    """
+    methods = [tool for tool in ["ResFinder", "NCBIAMRFinder", "CARD-RGI"] if paths.get(tool)]
+    dfs = [read_amr(paths[tool], tool) for tool in methods]
+    df = merge_pheno(combine_tables(dfs, on="mo"), read_pheno(paths, species))
+    return df, methods + ["phenotype"]
+
+
+def consensus_samples(views):
+    return [predict_consensus(view) for view in views]
+
+
+def consensus_batch(views):
+    tiers, antibiotics, tools, ran = stack_views(views)
+    return predict_consensus_batch(tiers, tools, ran=ran)
+
+
+def random_tables(rng, on=None):
+    """
+    2-5 tables (empty ones, equal and unordered indexes, Series) as combined by the pipeline (on="mo") and view_by_antibiotic
+    """
+    tables = []
+    keys = [f"g{i}" for i in rng.permutation(30)] if on or rng.random() < 0.5 else list(rng.permutation(30))
+    for i in range(int(rng.integers(2, 6))):
+        n = int(rng.integers(0, 10)) if rng.random() < 0.8 else 0
+        if tables and rng.random() < 0.2:
+            index = list(tables[0].index)
+        else:
+            index = [keys[j] for j in rng.choice(12, n, replace=False)] if rng.random() < 0.7 else keys[:n]
+        s = pd.Series(rng.integers(0, 3, len(index)).astype(float), index=pd.Index(index, name="ind", dtype=object if on else None), name=f"color_T{i}")
+        if on:
+            tables.append(pd.DataFrame({f"T{i}": s.index, on: s.index, s.name: s.to_numpy()}))
+        else:
+            tables.append(s if rng.random() < 0.3 else s.to_frame())
+    return tables
+
+
+class FinishedExecutor:
+    """
+    executor of check_service_paths, jobs finish immediately without running the tools
+    """
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result((0, None))
+        return future
+
+
+#### functions that might be called from outside ####
+
+def check_service_paths():
+    """
+    submits jobs with relative and absolute output directories to a service on a UNIX socket from a working directory
+    outside the service outdir. relative directories are created below outdir, directories outside outdir are rejected
+    return: list of failed checks
+    """
+    from abr_combine.service import JobQueue, ServiceHandler, UnixHTTPServer, submit
+    failed = []
+    cwd = os.getcwd()
+    with TemporaryDirectory() as tmpdir:
+        outdir = os.path.join(tmpdir, "svc")
+        client_dir = os.path.join(tmpdir, "client")
+        os.makedirs(client_dir)
+        fasta = os.path.join(client_dir, "s.fasta")
+        with open(fasta, "w") as outf_h:
+            outf_h.write(">contig\nACGT\n")
+
+        socket_path = os.path.join(tmpdir, "socket")
+        server = UnixHTTPServer(socket_path, ServiceHandler)
+        server.queue = JobQueue(FinishedExecutor(), {}, outdir, 1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            os.chdir(client_dir)
+            for options, expected in [({"outtable": "sub1"}, os.path.join(outdir, "sub1")),
+                                      ({"outtable": "sub2", "excelfile": "sub2/xls"}, os.path.join(outdir, "sub2", "xls")),
+                                      ({"outtable": os.path.join(outdir, "sub3")}, os.path.join(outdir, "sub3"))]:
+                try:
+                    submit(fasta, options=options, socket_path=socket_path)
+                except ValueError as e:
+                    failed.append(f"{options} rejected: {e}")
+                    continue
+                if not os.path.isdir(expected):
+                    failed.append(f"{options}: {expected} not created")
+            if os.path.exists(os.path.join(client_dir, "sub1")):
+                failed.append("sub1 created in the working directory of the client")
+            for path in ["../client", client_dir, "sub1/../../client"]:
+                try:
+                    submit(fasta, options={"outtable": path}, socket_path=socket_path)
+                    failed.append(f"{path} outside outdir accepted")
+                except ValueError:
+                    pass
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+            server.server_close()
+            thread.join()
+    return failed
+
+
+def check_shards(input_fasta=default_shard_input, species="Escherichia coli", methods=("CARD-RGI", "NCBIAMRFinder"), shards=4, threads=1, min_size=None):
+    """
+    runs the installed tools (real executables) on the complete input and on shards of it and compares the merged
+    shard table with the table of the complete run byte by byte. also checks tools that are not in util.shardable
+    return: dict tool -> "identical", "not installed", "failed" or description of the difference
+    """
+    from abr_combine.util import run_tools, find_tools, shard_tables
+    from abr_combine.fasta import fasta_input, shard_fasta, min_shard_size
+    results = {}
+    with TemporaryDirectory() as tmpdir:
+        with fasta_input(input_fasta, tmpdir) as input_file:
+            shard_files, contigs = shard_fasta(input_file, os.path.join(tmpdir, "shards"), shards, min_size or min_shard_size)
+            if len(shard_files) < 2:
+                return {tool: "input too small for shards" for tool in methods}
+            missing = find_tools(list(methods))
+            for tool in methods:
+                if tool in missing:
+                    results[tool] = "not installed"
+                    continue
+                tables = []
+                for run, files in [("complete", None), ("sharded", shard_files)]:
+                    rundir = os.path.join(tmpdir, f"{tool}.{run}")
+                    os.makedirs(rundir)
+                    if run_tools([tool], input_file, species, rundir, threads, shards=files, contigs=contigs, sharded=[tool]):
+                        tables.append(shard_tables[tool]["table"].format(os.path.join(rundir, tool)))
+                if len(tables) < 2:
+                    results[tool] = "failed"
+                    continue
+                with open(tables[0], "r") as inf_h:
+                    complete = inf_h.readlines()
+                with open(tables[1], "r") as inf_h:
+                    sharded = inf_h.readlines()
+                if complete == sharded:
+                    results[tool] = "identical"
+                else:
+                    only_complete = len(set(complete) - set(sharded))
+                    only_sharded = len(set(sharded) - set(complete))
+                    results[tool] = f"differs: {only_complete} rows only in the complete run, {only_sharded} rows only in the sharded run" + \
+                                    ("" if only_complete or only_sharded else ", same rows in another order")
+    return results
+
+
+def check_combine_tables(trials=1000, seed=0):
+    """
+    compares combine_tables with successive pairwise outer merges (rows, columns and dtypes) on random tables
+    return: number of differing results
+    """
+    rng = np.random.default_rng(seed)
+    failed = 0
+    for i in range(trials):
+        on = "mo" if i % 2 else None
+        tables = random_tables(rng, on)
+        if all(t.empty for t in tables):
+            continue
+        expected = merge_pairwise([t.to_frame() if isinstance(t, pd.Series) else t for t in tables], on)
+        try:
+            pd.testing.assert_frame_equal(combine_tables(tables, on), expected)
+        except AssertionError as e:
+            failed += 1
+            sys.stderr.write(f"combine_tables differs from pairwise merges (trial {i}, on={on}): {e}\n")
+    return failed
+
+
+def bench_view_engines(df, methods, repeat=5):
+    """
+    compares the engines of view_by_antibiotic
+    return: dict engine -> seconds (best of repeat)
+    """
+    timings = {}
+    views = {}
+    for engine in ["pandas", "dict"]:
+        timings[engine], views[engine] = best_time(view_by_antibiotic, repeat, df, methods, engine)
+    pd.testing.assert_frame_equal(views["pandas"], views["dict"])
+    return timings
+
+
+def bench_stage(records, stage, func, args, repeat, **info):
+    """
+    times func(*args) (best of repeat) and measures its peak memory in a separate run
+    return: result of func
+    """
+    try:
+        seconds, result = best_time(func, repeat, *args)
+        peak = peak_memory(func, *args)
+    except Exception as e:
+        records.append(dict(stage=stage, error=f"{type(e).__name__}: {e}", **info))
+        sys.stderr.write(f"{stage} failed: {type(e).__name__}: {e}\n")
+        return None
+    records.append(dict(stage=stage, seconds=seconds, peak_bytes=peak, **info))
+    sys.stderr.write(f"{stage} {info}: {seconds * 1000:.2f} ms, peak {peak / 1048576:.1f} MB\n")
+    return result
+
+
+def bench_pipeline(paths, repeat=3, species="", **info):
+    """
+    per stage timings for one set of tool outputs
+    return: list of records, view1 (for sample level benchmarks)
+    """
+    records = []
+    dfs = []
+    methods = [tool for tool in ["ResFinder", "NCBIAMRFinder", "CARD-RGI"] if paths.get(tool)]
+    for tool in methods:
+        dfs.append(bench_stage(records, f"read_amr:{tool}", read_amr, [paths[tool], tool], repeat, **info))
+    if paths.get("ResFinder"):
+        bench_stage(records, "read_pointfinder", read_pointfinder, [os.path.join(paths["ResFinder"], "PointFinder_table.txt")], repeat, **info)
+
+    df = bench_stage(records, "combine_tables", combine_tables, [dfs, "mo"], repeat, **info)
+    df_pheno = read_pheno(paths, species)
+    df = bench_stage(records, "phenotype_merge", merge_pheno, [df, df_pheno], repeat, **info)
+    methods = methods + ["phenotype"]
+
+    view1 = bench_stage(records, "view_by_antibiotic", view_by_antibiotic, [df, methods], repeat, **info)
+    bench_stage(records, "view_by_antibiotic:pandas", view_by_antibiotic, [df, methods, "pandas"], repeat, **info)
+    view2 = bench_stage(records, "view_by_genes", view_by_genes, [df, methods], repeat, **info)
+    bench_stage(records, "color_table", lambda v: color_table(v).to_html(), [view2], repeat, **info)
+    bench_stage(records, "predict_consensus", predict_consensus, [view1], repeat, **info)
+    return records, view1
+
+
+def bench_samples(view1, n_samples, repeat=3):
+    """
+    consensus prediction for n_samples samples with view1 of the same size
+    """
+    records = []
+    rng = np.random.default_rng(n_samples)
+    views = []
+    for i in range(n_samples):
+        view = view1.copy()
+        for c in [c for c in view.columns if c.startswith("color_")]:
+            view[c] = rng.permutation(view[c].to_numpy())
+        views.append(view)
+    bench_stage(records, "predict_consensus:samples", consensus_samples, [views], repeat, samples=n_samples, antibiotics=len(view1))
+    bench_stage(records, "predict_consensus:batch", consensus_batch, [views], repeat, samples=n_samples, antibiotics=len(view1))
+    return records
+
+
+def bench_pointfinder(mutations=default_mutations, n_genes=default_point_genes, repeat=3):
+    """
+    read_pointfinder on synthetic PointFinder reports of each output format with n_genes gene blocks
+    return: list of records
+    """
+    records = []
+    with TemporaryDirectory() as tmpdir:
+        for n in mutations:
+            for fmt, (name, writer) in pointfinder_writers.items():
+                path = os.path.join(tmpdir, name)
+                writer(path, n, n_genes=n_genes)
+                bench_stage(records, f"read_pointfinder:{fmt}", read_pointfinder, [path], repeat, mutations=n, genes=n_genes,
+                            file_bytes=os.path.getsize(path))
+                os.remove(path)
+    return records
+
+
+def bench_startup(modules=startup_modules, repeat=5):
+    """
+    wall time of a fresh interpreter importing each module (best of repeat) and the import times reported by
+    python -X importtime. heavy: heavy_modules that are loaded by the import, top: slowest direct imports
+    return: list of records
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    records = []
+    baseline = None
+    for module in ["sys"] + list(modules):
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=root,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+            seconds = time.perf_counter() - start
+            if proc.returncode != 0:
+                break
+            if best is None or seconds < best[0]:
+                best = (seconds, proc.stderr)
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+            records.append({"stage": "startup", "module": module, "error": error})
+            sys.stderr.write(f"import {module} failed: {error}\n")
+            continue
+        if module == "sys":
+            # interpreter startup without any import
+            baseline = best[0]
+            continue
+
+        times = parse_importtime(best[1])
+        # direct imports of the module (and of the interpreter startup)
+        top = sorted([(name, t[1]) for name, t in times.items() if t[2] == 1], key=lambda x: -x[1])[:5]
+        records.append({"stage": "startup", "module": module, "seconds": best[0], "interpreter_seconds": baseline,
+                        "import_seconds": sum(t[0] for t in times.values()) / 1e6, "heavy": [m for m in heavy_modules if m in times],
+                        "top": [[name, us / 1e6] for name, us in top]})
+        sys.stderr.write(f"import {module}: {best[0] * 1000:.0f} ms (interpreter {baseline * 1000:.0f} ms), heavy: {', '.join(records[-1]['heavy']) or '-'}\n")
+    return records
+
+
+def run_suite(sizes=default_sizes, samples=default_samples, repeat=3, recorded=None, species=""):
+    """
+    return: dict with meta data and a list of records (stage, seconds, peak_bytes, size information)
+    """
+    results = []
+    view1 = None
+    with TemporaryDirectory() as tmpdir:
+        if recorded:
+            records, view1 = bench_pipeline(fixture_paths(recorded), repeat, species, fixture="recorded", hits=None)
+            results.extend(records)
+        for size in sizes:
+            paths = write_fixtures(os.path.join(tmpdir, str(size)), size)
+            records, view = bench_pipeline(paths, repeat, fixture="synthetic", hits=size)
+            results.extend(records)
+            if view1 is None or size == 1000:
+                view1 = view
+
+    for n in samples:
+        results.extend(bench_samples(view1, n, repeat))
+
+    from abr_combine.version import version
+    meta = {"date": datetime.now().isoformat(timespec="seconds"), "abr_combine": version, "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__, "platform": platform.platform(), "repeat": repeat}
+    return {"meta": meta, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the abr_combine processing stages")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    suite = subparsers.add_parser("suite", help="per stage timings and peak memory on synthetic (and recorded) tool outputs as JSON")
+    suite.add_argument("--sizes", dest="sizes", help="hits per tool of the synthetic fixtures [10 1000 100000]", type=int, nargs="+", default=default_sizes)
+    suite.add_argument("--samples", dest="samples", help="numbers of samples for sample level stages [1 100 10000]", type=int, nargs="+", default=default_samples)
+    suite.add_argument("--recorded", dest="recorded", help="directory with recorded tool outputs: NCBIAMRFinder.tsv, CARD-RGI.txt, ResFinder/ [phenotypes.txt]", default=None)
+    suite.add_argument("-s", "--species", dest="species", help="species of the recorded outputs", default="")
+    suite.add_argument("--repeat", dest="repeat", help="repetitions per stage, best time is reported [3]", type=int, default=3)
+    suite.add_argument("-o", dest="output", help="JSON output file [STDOUT]", default=None)
+
+    combine = subparsers.add_parser("combine", help="check combine_tables against pairwise outer merges on random tables, exits with 1 on differences")
+    combine.add_argument("--trials", dest="trials", help="random sets of tables [1000]", type=int, default=1000)
+    combine.add_argument("--seed", dest="seed", help="random seed [0]", type=int, default=0)
+
+    shard_check = subparsers.add_parser("shards", help="compare the tables of the installed tools on the complete input and on its shards, "
+                                        "exits with 1 if a tool in util.shardable differs or fails (tools that are not installed are skipped)")
+    shard_check.add_argument("-i", "--input", dest="input_fasta", help=f"input fasta [{default_shard_input}]", default=default_shard_input)
+    shard_check.add_argument("-s", "--species", dest="species", help="species name [Escherichia coli]", default="Escherichia coli")
+    shard_check.add_argument("--shards", dest="shards", help="number of shards [4]", type=int, default=4)
+    shard_check.add_argument("--min_size", dest="min_size", help="minimal number of bases per shard [fasta.min_shard_size]", type=int, default=None)
+    shard_check.add_argument("--threads", dest="threads", help="threads per tool run [1]", type=int, default=1)
+
+    subparsers.add_parser("service", help="check the output directories of jobs submitted to the service from outside its outdir, exits with 1 on failures")
+
+    views = subparsers.add_parser("views", help="compare the engines of view_by_antibiotic")
+    views.add_argument("--hits", dest="hits", help="number of hits per tool in synthetic fixtures [100]", type=int, default=100)
+    views.add_argument("--repeat", dest="repeat", help="repetitions per engine, best time is reported [5]", type=int, default=5)
+    views.add_argument("--amrfinder_result", dest="amrfinder_result", help="recorded NCBIAmrFinderPlus output instead of fixtures", default=None)
+    views.add_argument("--rgi_result", dest="rgi_result", help="recorded CARD-RGI output instead of fixtures", default=None)
+    views.add_argument("--resfinder_result", dest="resfinder_result", help="recorded ResFinder output directory instead of fixtures", default=None)
+    views.add_argument("-s", "--species", dest="species", help="species of the recorded outputs", default="")
+    startup = subparsers.add_parser("startup", help="import time of the command line entry and the processing modules (python -X importtime) as JSON")
+    startup.add_argument("--modules", dest="modules", help=f"modules to import [{' '.join(startup_modules)}]", nargs="+", default=startup_modules)
+    startup.add_argument("--repeat", dest="repeat", help="repetitions per module, best time is reported [5]", type=int, default=5)
+    startup.add_argument("-o", dest="output", help="JSON output file [STDOUT]", default=None)
+    pointfinder = subparsers.add_parser("pointfinder", help="read_pointfinder on large multi-gene PointFinder reports in all output formats as JSON")
+    pointfinder.add_argument("--mutations", dest="mutations", help=f"mutations per report [{' '.join(map(str, default_mutations))}]", type=int, nargs="+", default=default_mutations)
+    pointfinder.add_argument("--genes", dest="genes", help=f"gene blocks per report [{default_point_genes}]", type=int, default=default_point_genes)
+    pointfinder.add_argument("--repeat", dest="repeat", help="repetitions per report, best time is reported [3]", type=int, default=3)
+    pointfinder.add_argument("-o", dest="output", help="JSON output file [STDOUT]", default=None)
+    args = parser.parse_args()
+
+    if args.command == "pointfinder":
+        from abr_combine.version import version
+        meta = {"date": datetime.now().isoformat(timespec="seconds"), "abr_combine": version, "python": platform.python_version(),
+                "pandas": pd.__version__, "platform": platform.platform(), "repeat": args.repeat}
+        report = {"meta": meta, "results": bench_pointfinder(args.mutations, args.genes, args.repeat)}
+        if args.output:
+            with open(args.output, "w") as outf_h:
+                json.dump(report, outf_h, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+        return
+
+    if args.command == "startup":
+        from abr_combine.version import version
+        meta = {"date": datetime.now().isoformat(timespec="seconds"), "abr_combine": version, "python": platform.python_version(),
+                "platform": platform.platform(), "repeat": args.repeat}
+        report = {"meta": meta, "results": bench_startup(args.modules, args.repeat)}
+        if args.output:
+            with open(args.output, "w") as outf_h:
+                json.dump(report, outf_h, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+        return
+
+    if args.command == "combine":
+        failed = check_combine_tables(args.trials, args.seed)
+        sys.stdout.write(f"combine_tables: {failed} of {args.trials} random tables differ from pairwise merges\n")
+        exit(1 if failed else 0)
+
+    if args.command == "shards":
+        from abr_combine.util import shardable
+        results = check_shards(args.input_fasta, args.species, shards=args.shards, threads=args.threads, min_size=args.min_size)
+        for tool, result in results.items():
+            sys.stdout.write(f"{tool}{' (shardable)' if tool in shardable else ''}: {result}\n")
+        exit(1 if any(tool in shardable and result not in ["identical", "not installed"] for tool, result in results.items()) else 0)
+
+    if args.command == "service":
+        failed = check_service_paths()
+        for check in failed:
+            sys.stderr.write(f"service: {check}\n")
+        sys.stdout.write(f"service: {len(failed)} failed checks of the job output directories\n")
+        exit(1 if failed else 0)
+
+    if args.command == "suite":
+        report = run_suite(args.sizes, args.samples, args.repeat, args.recorded, args.species)
+        if args.output:
+            with open(args.output, "w") as outf_h:
+                json.dump(report, outf_h, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+        return
+
+    with TemporaryDirectory() as tmpdir:
+        if any([args.amrfinder_result, args.rgi_result, args.resfinder_result]):
+            paths = {"NCBIAMRFinder": args.amrfinder_result, "CARD-RGI": args.rgi_result, "ResFinder": args.resfinder_result}
+            label = "recorded"
+        else:
+            paths = write_fixtures(tmpdir, args.hits)
+            label = f"synthetic, {args.hits} hits per tool"
+        df, methods = merged_table(paths, args.species)
+
+    timings = bench_view_engines(df, methods, args.repeat)
+    sys.stdout.write(f"view_by_antibiotic ({label}, {len(df)} merged rows):\n")
+    for engine, seconds in timings.items():
+        sys.stdout.write(f"  {engine}: {seconds * 1000:.2f} ms\n")
+    sys.stdout.write(f"  speedup: {timings['pandas'] / timings['dict']:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
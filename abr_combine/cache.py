@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import hashlib
+import json
+import shutil
+from tempfile import mkdtemp
+
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "abr_combine", "results")
+default_cache_size = 10240 # MB
+
+# k-mer index of abr_combine.prescreen
+default_index_dir = os.path.join(os.path.expanduser("~"), ".cache", "abr_combine", "prescreen")
+
+
+#### internal functions ####
+
+def entry_path(cachedir, key):
+    return os.path.join(cachedir, key[:2], key)
+
+
+def tool_outputs(directory, tool):
+    """
+    files and directories written by a tool with output prefix {directory}/{tool}
+    """
+    return [f for f in os.listdir(directory) if f == tool or f.startswith(tool + ".")]
+
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+def copy_path(src, dst):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+#### functions that might be called from outside ####
+
+def file_digest(path, blocksize=1048576):
+    digest = hashlib.sha256()
+    with open(path, "rb") as inf_h:
+        for block in iter(lambda: inf_h.read(blocksize), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(digest, tool, species, version, databases=None):
+    """
+    tool output only depends on the input sequence, the species (organism options of the tools),
+    the tool and the tool/database version. databases: fingerprint of the database files (abr_combine.registry.fingerprint),
+    so results are not reused after database updates that do not change the recorded version
+    """
+    species = " ".join(species.split(" ")[:2]).lower()
+    return hashlib.sha256("\t".join([digest, tool, species, version, json.dumps(databases or [])]).encode()).hexdigest()
+
+
+def restore_result(cachedir, key, tmpdir, tool):
+    """
+    copies a cached tool output into tmpdir
+    return: True if the result was found in the cache
+    """
+    entry = entry_path(cachedir, key)
+    if not os.path.isdir(entry):
+        return False
+    try:
+        for f in os.listdir(entry):
+            copy_path(os.path.join(entry, f), os.path.join(tmpdir, f))
+        # mark entry as recently used for eviction
+        os.utime(entry)
+    except OSError as e:
+        sys.stderr.write(f"Could not restore cached result of {tool}: {e}\n")
+        return False
+    sys.stdout.write(f"Using cached result of {tool}\n")
+    return True
+
+
+def store_result(cachedir, key, tmpdir, tool):
+    entry = entry_path(cachedir, key)
+    if os.path.isdir(entry):
+        return
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    staging = mkdtemp(dir=os.path.dirname(entry), prefix=".tmp")
+    try:
+        for f in tool_outputs(tmpdir, tool):
+            copy_path(os.path.join(tmpdir, f), os.path.join(staging, f))
+        os.rename(staging, entry)
+    except OSError as e:
+        # entry written by another process in the meantime or cache not writable
+        sys.stderr.write(f"Could not cache result of {tool}: {e}\n")
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def evict(cachedir, max_size=default_cache_size):
+    """
+    removes least recently used entries until the cache is smaller than max_size (MB)
+    """
+    if not os.path.isdir(cachedir):
+        return
+    entries = []
+    for prefix in os.listdir(cachedir):
+        prefix_dir = os.path.join(cachedir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for key in os.listdir(prefix_dir):
+            if key.startswith("."):
+                continue
+            entry = os.path.join(prefix_dir, key)
+            try:
+                entries.append([os.path.getmtime(entry), path_size(entry), entry])
+            except OSError:
+                pass
+
+    total = sum(e[1] for e in entries)
+    for mtime, size, entry in sorted(entries):
+        if total <= max_size * 1024 * 1024:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import importlib.util
+import numpy as np
+import pandas as pd
+
+from abr_combine.transform import color_table, colors
+
+# fill colors of the color tiers in transform.colors
+color_hex = {"limegreen": "#32CD32", "lightgreen": "#90EE90", "lightgrey": "#D3D3D3"}
+
+
+#### internal functions ####
+
+def cell_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def write_cell(worksheet, row, col, value, fmt=None):
+    value = cell_value(value)
+    if value is None:
+        if fmt is not None:
+            worksheet.write_blank(row, col, None, fmt)
+    elif isinstance(value, bool):
+        worksheet.write_boolean(row, col, value, fmt)
+    elif isinstance(value, (int, float)):
+        worksheet.write_number(row, col, value, fmt)
+    else:
+        worksheet.write_string(row, col, str(value), fmt)
+
+
+def write_sheet(workbook, sheet_name, df, formats):
+    """
+    writes df row by row as pandas would, color_<column> columns are not written but set the fill of <column>
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    columns = [c for c in df.columns if not str(c).startswith("color_")]
+    tiers = np.full((len(df), len(columns)), -1, dtype=np.int64)
+    for j, c in enumerate(columns):
+        if f"color_{c}" in df.columns:
+            tiers[:, j] = pd.to_numeric(df[f"color_{c}"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+
+    if df.index.name is not None:
+        write_cell(worksheet, 0, 0, df.index.name, formats["header"])
+    for j, c in enumerate(columns):
+        write_cell(worksheet, 0, j + 1, c, formats["header"])
+
+    values = df[columns].to_numpy(dtype=object)
+    for i, index in enumerate(df.index):
+        write_cell(worksheet, i + 1, 0, index, formats["header"])
+        for j, value in enumerate(values[i]):
+            write_cell(worksheet, i + 1, j + 1, value, formats["tiers"][tiers[i, j]] if tiers[i, j] >= 0 else None)
+
+
+def write_excel_xlsxwriter(excelfile, sheets):
+    import xlsxwriter
+    with xlsxwriter.Workbook(excelfile, {"constant_memory": True}) as workbook:
+        formats = {"header": workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"}),
+                   "tiers": [workbook.add_format({"pattern": 1, "bg_color": color_hex[c]}) for c in colors]}
+        for sheet_name, df in sheets:
+            write_sheet(workbook, sheet_name, df, formats)
+
+
+def write_excel_openpyxl(excelfile, sheets):
+    writer = pd.ExcelWriter(excelfile, engine='openpyxl')
+    for sheet_name, df in sheets:
+        if any(str(c).startswith("color_") for c in df.columns):
+            df = color_table(df)
+        df.to_excel(writer, sheet_name)
+    writer.save()
+
+
+#### functions that might be called from outside ####
+
+def write_excel(excelfile, sheets, engine=None):
+    """
+    writes one sheet per (sheet name, pd.DataFrame) of sheets, color_<column> columns are used as cell colors of <column>.
+    engine: "xlsxwriter" (streaming, default if installed) or "openpyxl" (pandas Styler)
+    """
+    if engine is None:
+        engine = "xlsxwriter" if importlib.util.find_spec("xlsxwriter") is not None else "openpyxl"
+    if engine == "xlsxwriter":
+        write_excel_xlsxwriter(excelfile, sheets)
+    else:
+        write_excel_openpyxl(excelfile, sheets)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import gzip
+import bz2
+import shutil
+import tarfile
+import time
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+
+# memory backed directory used for decompressed input if available
+default_fast_tmp = "/dev/shm"
+
+# required free space in fast_tmp relative to the size of the compressed input
+fast_tmp_ratio = 5
+
+magic_numbers = {b"\x1f\x8b": "gzip", # also bgzip
+                 b"\x28\xb5\x2f\xfd": "zstd",
+                 b"BZh": "bz2",
+                 }
+
+fasta_extensions = [".fasta", ".fa", ".fna", ".fas", ".fsa", ".contigs"]
+
+compression_extensions = [".gz", ".bgz", ".bz2", ".zst"]
+
+# minimal number of bases per shard, gene prediction of the tools (prodigal in RGI) needs enough sequence for training
+min_shard_size = 1000000
+
+
+#### internal functions ####
+
+def detect_compression(path):
+    with open(path, "rb") as inf_h:
+        start = inf_h.read(4)
+    for magic, compression in magic_numbers.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def open_compressed(path, compression):
+    if compression == "gzip":
+        # gzip.open reads multi-member files, this includes bgzip
+        return gzip.open(path, "rb")
+    elif compression == "bz2":
+        return bz2.open(path, "rb")
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            sys.stderr.write("zstd compressed input requires the python package zstandard\n")
+            raise
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def strip_compression(filename):
+    for ext in compression_extensions:
+        if filename.endswith(ext):
+            return filename[:-len(ext)]
+    return filename
+
+
+def is_tar_archive(path):
+    try:
+        return tarfile.is_tarfile(path)
+    except (OSError, tarfile.TarError):
+        return False
+
+
+def write_tar_fasta(path, outf_h):
+    """
+    concatenates all fasta files of a (compressed) tar archive
+    """
+    with tarfile.open(path, "r:*") as tar_h:
+        for member in tar_h:
+            name = member.name[:-3] if member.name.endswith(".gz") else member.name
+            if not member.isfile() or not any(name.endswith(ext) for ext in fasta_extensions):
+                continue
+            inf_h = tar_h.extractfile(member)
+            if member.name.endswith(".gz"):
+                inf_h = gzip.GzipFile(fileobj=inf_h)
+            shutil.copyfileobj(inf_h, outf_h, 1048576)
+
+
+def select_tmpdir(input_fasta, tmpdir, fast_tmp=default_fast_tmp):
+    """
+    prefers the memory backed fast_tmp if it is writable and has enough free space
+    """
+    if not fast_tmp or not os.path.isdir(fast_tmp) or not os.access(fast_tmp, os.W_OK):
+        return tmpdir
+    stat = os.statvfs(fast_tmp)
+    if stat.f_bavail * stat.f_frsize < os.path.getsize(input_fasta) * fast_tmp_ratio:
+        return tmpdir
+    return fast_tmp
+
+
+def index_fasta(path):
+    """
+    return: list of (contig name, byte offset, byte length, sequence length) in input order
+    """
+    records = []
+    offset = 0
+    with open(path, "rb") as inf_h:
+        for line in inf_h:
+            if line.startswith(b">"):
+                records.append([line[1:].split()[0].decode() if line[1:].split() else "", offset, 0, 0])
+            elif records:
+                records[-1][3] += len(line.strip())
+            offset += len(line)
+            if records:
+                records[-1][2] += len(line)
+    return [tuple(r) for r in records]
+
+
+def balance_shards(lengths, shards):
+    """
+    assigns contigs to shards, largest contigs first to the shard with the fewest bases
+    return: shard number of each contig
+    """
+    sizes = [0] * shards
+    assignment = [0] * len(lengths)
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        shard = sizes.index(min(sizes))
+        assignment[i] = shard
+        sizes[shard] += lengths[i]
+    return assignment
+
+
+#### functions that might be called from outside ####
+
+def sample_name(filename):
+    name = strip_compression(os.path.basename(filename))
+    if name.endswith(".tar"):
+        name = name[:-4]
+    for ext in fasta_extensions:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def shard_fasta(input_file, outdir, shards, min_size=min_shard_size):
+    """
+    splits an uncompressed fasta file into at most shards files with similar numbers of bases (at least min_size each).
+    contigs are not split and keep their input order within a shard
+    return: list of shard files (only input_file if it is not split), contig names in input order
+    """
+    records = index_fasta(input_file)
+    shards = max(1, min(shards, len(records), sum(r[3] for r in records) // min_size))
+    contigs = [r[0] for r in records]
+    if shards == 1:
+        return [input_file], contigs
+
+    assignment = balance_shards([r[3] for r in records], shards)
+    os.makedirs(outdir, exist_ok=True)
+    shard_files = [os.path.join(outdir, f"shard{i}.fasta") for i in range(shards)]
+    with open(input_file, "rb") as inf_h:
+        for i, shard_file in enumerate(shard_files):
+            with open(shard_file, "wb") as outf_h:
+                for record, shard in zip(records, assignment):
+                    if shard == i:
+                        inf_h.seek(record[1])
+                        data = inf_h.read(record[2])
+                        outf_h.write(data if data.endswith(b"\n") else data + b"\n")
+    sys.stdout.write(f"Split {input_file} into {shards} shards\n")
+    return shard_files, contigs
+
+
+@contextmanager
+def fasta_input(input_fasta, tmpdir, fast_tmp=default_fast_tmp):
+    """
+    provides the input as uncompressed fasta file that can be read by all tools at the same time.
+    plain fasta files are used as they are, compressed files (gzip, bgzip, bz2, zstd) and tar archives
+    of fasta files are decompressed once into fast_tmp (memory backed) or tmpdir
+    yields: path to the uncompressed fasta file
+    """
+    if not input_fasta:
+        yield input_fasta
+        return
+
+    compression = detect_compression(input_fasta)
+    tar = is_tar_archive(input_fasta)
+    if not compression and not tar:
+        yield input_fasta
+        return
+
+    with TemporaryDirectory(dir=select_tmpdir(input_fasta, tmpdir, fast_tmp)) as input_dir:
+        input_file = os.path.join(input_dir, "input_file.fasta")
+        start = time.time()
+        with open(input_file, "wb") as outf_h:
+            if tar:
+                write_tar_fasta(input_fasta, outf_h)
+            else:
+                with open_compressed(input_fasta, compression) as inf_h:
+                    shutil.copyfileobj(inf_h, outf_h, 1048576)
+        seconds = max(time.time() - start, 1e-6)
+        size = os.path.getsize(input_file) / 1048576
+        sys.stdout.write(f"Decompressed {input_fasta} to {input_dir}: {size:.1f} MB in {seconds:.2f} s ({size / seconds:.1f} MB/s)\n")
+        yield input_file
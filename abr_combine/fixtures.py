@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import os
+import csv
+import json
+import random
+
+#### synthetic tool outputs for benchmarks, no tool installation required ####
+
+gene_families = [("blaCTX-M", "BETA-LACTAM", "CEPHALOSPORIN", "cephalosporin; penam", "Amoxicillin, Ampicillin, Cefotaxime"),
+                 ("blaTEM", "BETA-LACTAM", "BETA-LACTAM", "monobactam; cephalosporin; penam", "Amoxicillin, Ampicillin"),
+                 ("blaOXA", "BETA-LACTAM", "CARBAPENEM", "carbapenem; cephalosporin; penam", "Amoxicillin, Meropenem"),
+                 ("aac(6')-Ib", "AMINOGLYCOSIDE", "AMIKACIN/KANAMYCIN/TOBRAMYCIN", "aminoglycoside antibiotic", "Amikacin, Tobramycin"),
+                 ("aph(3'')-Ib", "AMINOGLYCOSIDE", "STREPTOMYCIN", "aminoglycoside antibiotic", "Streptomycin"),
+                 ("tet", "TETRACYCLINE", "TETRACYCLINE", "tetracycline antibiotic", "Tetracycline, Doxycycline"),
+                 ("sul", "SULFONAMIDE", "SULFONAMIDE", "sulfonamide antibiotic", "Sulfamethoxazole"),
+                 ("dfrA", "TRIMETHOPRIM", "TRIMETHOPRIM", "diaminopyrimidine antibiotic", "Trimethoprim"),
+                 ("qnrS", "QUINOLONE", "QUINOLONE", "fluoroquinolone antibiotic", "Ciprofloxacin, Nalidixic acid"),
+                 ("catA", "PHENICOL", "CHLORAMPHENICOL", "phenicol antibiotic", "Chloramphenicol"),
+                 ]
+
+point_genes = [("gyrA", "S", 83, "L", "Nalidixic acid,Ciprofloxacin"),
+               ("gyrA", "D", 87, "N", "Nalidixic acid,Ciprofloxacin"),
+               ("parC", "S", 80, "I", "Ciprofloxacin"),
+               ("parE", "S", 458, "A", "Ciprofloxacin"),
+               ("pmrB", "V", 161, "G", "Colistin"),
+               ]
+
+amrfinder_header = ["Protein identifier", "Contig id", "Start", "Stop", "Strand", "Gene symbol", "Sequence name", "Scope", "Element type",
+                    "Element subtype", "Class", "Subclass", "Method", "Target length", "Reference sequence length",
+                    "% Coverage of reference sequence", "% Identity to reference sequence", "Alignment length",
+                    "Accession of closest sequence", "Name of closest sequence", "HMM id", "HMM description"]
+
+rgi_header = ["ORF_ID", "Contig", "Start", "Stop", "Orientation", "Cut_Off", "Pass_Bitscore", "Best_Hit_Bitscore", "Best_Hit_ARO",
+              "Best_Identities", "ARO", "Model_type", "SNPs_in_Best_Hit_ARO", "Other_SNPs", "Drug Class", "Resistance Mechanism",
+              "AMR Gene Family", "Predicted_DNA", "Predicted_Protein", "CARD_Protein_Sequence",
+              "Percentage Length of Reference Sequence", "ID", "Model_ID", "Nudged", "Note"]
+
+resfinder_header = ["Resistance gene", "Identity", "Alignment Length/Gene Length", "Coverage", "Position in reference", "Contig",
+                    "Position in contig", "Phenotype", "Accession no."]
+
+
+def synthetic_genes(n_genes, seed=0):
+    """
+    return: list of (gene name, family) with allele numbers, the same for all tools of one seed
+    """
+    rng = random.Random(seed)
+    genes = []
+    for i in range(n_genes):
+        family = gene_families[i % len(gene_families)]
+        # letter code keeps the genes distinct after removal of allele numbers
+        number = i // len(gene_families)
+        code = ""
+        while True:
+            code = "abcdefghijklmnopqrstuvwxyz"[number % 26] + code
+            number = number // 26
+            if not number:
+                break
+        genes.append((f"{family[0]}{code}-{i % 3 + 1}", family))
+    rng.shuffle(genes)
+    return genes
+
+
+def write_amrfinder(path, n_hits, seed=0):
+    rng = random.Random(seed)
+    genes = synthetic_genes(max(n_hits // 2, 1), seed)
+    with open(path, "w", newline="") as outf_h:
+        writer = csv.writer(outf_h, delimiter="\t", lineterminator="\n")
+        writer.writerow(amrfinder_header)
+        for i in range(n_hits):
+            name, family = genes[i % len(genes)]
+            identity, coverage = rng.choice([(100, 100), (99.5, 100), (92.1, 88.0)])
+            writer.writerow(["NA", f"contig{i // 10 + 1}", i * 1000 + 1, i * 1000 + 900, "+", name, f"{family[0]} family", "core", "AMR",
+                             "AMR", family[1], family[2], rng.choice(["EXACTX", "ALLELEX", "BLASTX"]), 300, 300, f"{coverage:.2f}",
+                             f"{identity:.2f}", 300, f"WP_{i:09d}.1", name, "NA", "NA"])
+
+
+def write_rgi(path, n_hits, seed=0):
+    rng = random.Random(seed + 1)
+    genes = synthetic_genes(max(n_hits // 2, 1), seed)
+    with open(path, "w", newline="") as outf_h:
+        writer = csv.writer(outf_h, delimiter="\t", lineterminator="\n")
+        writer.writerow(rgi_header)
+        for i in range(n_hits):
+            name, family = genes[i % len(genes)]
+            if i % 7 == 3:
+                name = f"Escherichia coli {family[0]} conferring resistance"
+            contig = f"contig{i // 10 + 1}_{i % 10 + 1}"
+            writer.writerow([f"{contig} # {i}", contig, i * 1000 + 1, i * 1000 + 900, "+", rng.choice(["Perfect", "Strict", "Loose"]),
+                             500, 600, name.replace("bla", ""), 99.0, 3000000 + i, "protein homolog model", "n/a", "n/a", family[3],
+                             "antibiotic inactivation", f"{family[0]} family", "ATG" * 100, "M" * 100, "M" * 100, 100.0, "gnl", i, "", ""])
+
+
+def write_resfinder(directory, n_hits, seed=0, n_mutations=None):
+    """
+    writes ResFinder_results_tab.txt and PointFinder_table.txt into directory
+    """
+    rng = random.Random(seed + 2)
+    genes = synthetic_genes(max(n_hits // 2, 1), seed)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "ResFinder_results_tab.txt"), "w", newline="") as outf_h:
+        writer = csv.writer(outf_h, delimiter="\t", lineterminator="\n")
+        writer.writerow(resfinder_header)
+        for i in range(n_hits):
+            name, family = genes[i % len(genes)]
+            identity, coverage = rng.choice([(100, 100), (99.5, 100), (92.1, 88.0)])
+            writer.writerow([name, f"{identity:.2f}", "900/900", f"{coverage:.2f}", "1..900", f"contig{i // 10 + 1}",
+                             f"{i * 1000 + 1}..{i * 1000 + 900}", family[4], f"AY{i:06d}"])
+
+    write_pointfinder(os.path.join(directory, "PointFinder_table.txt"), n_mutations if n_mutations is not None else max(n_hits // 10, 1), seed)
+
+
+def point_mutations(n_mutations, seed=0, n_genes=None):
+    """
+    n_mutations spread over n_genes genes
+    return: gene names, dict gene -> list of (ref, pos, alt, resistance)
+    """
+    rng = random.Random(seed + 3)
+    gene_names = sorted(set(g[0] for g in point_genes))
+    if n_genes:
+        gene_names.extend(f"gene{i}" for i in range(max(n_genes - len(gene_names), 0)))
+    mutations = {gene: [] for gene in gene_names}
+    for i in range(n_mutations):
+        gene, ref, pos, alt, resistance = point_genes[i % len(point_genes)] if i < len(point_genes) else \
+            (rng.choice(gene_names), rng.choice("ACDEFGHIKLMNPQRSTVWY"), rng.randint(1, 900), rng.choice("ACDEFGHIKLMNPQRSTVWY"), "Unknown")
+        mutations[gene].append((ref, pos, alt, resistance))
+    return gene_names, mutations
+
+
+def mutation_line(gene, ref, pos, alt, resistance):
+    return f"{gene} p.{ref}{pos}{alt}\t{ref}{ref}{ref} -> {alt}{alt}{alt}\t{ref} -> {alt}\t{resistance}\t1"
+
+
+def write_pointfinder(path, n_mutations, seed=0, n_genes=None):
+    """
+    PointFinder_table.txt with n_mutations spread over n_genes gene blocks
+    """
+    gene_names, mutations = point_mutations(n_mutations, seed, n_genes)
+    with open(path, "w") as outf_h:
+        outf_h.write("Chromosomal point mutations - Results\nSpecies: e.coli\n")
+        outf_h.write("Genes: %s\n\n\nKnown Mutations\n\n" % ", ".join(gene_names))
+        for gene in gene_names:
+            outf_h.write(f"{gene}\n")
+            if mutations[gene]:
+                outf_h.write("Mutation\tNucleotide change\tAmino acid change\tResistance\tPMID\n")
+                outf_h.write("\n".join(mutation_line(gene, *m) for m in mutations[gene]) + "\n")
+            else:
+                outf_h.write(f"No mutations found in {gene}\n")
+            outf_h.write("\n")
+
+
+def write_pointfinder_results(path, n_mutations, seed=0, n_genes=None):
+    """
+    PointFinder_results.txt with the mutations of write_pointfinder
+    """
+    gene_names, mutations = point_mutations(n_mutations, seed, n_genes)
+    with open(path, "w") as outf_h:
+        outf_h.write("Mutation\tNucleotide change\tAmino acid change\tResistance\tPMID\n")
+        for gene in gene_names:
+            for m in mutations[gene]:
+                outf_h.write(mutation_line(gene, *m) + "\n")
+
+
+def write_pointfinder_json(path, n_mutations, seed=0, n_genes=None):
+    """
+    ResFinder json output (seq_regions and seq_variations) with the mutations of write_pointfinder
+    """
+    gene_names, mutations = point_mutations(n_mutations, seed, n_genes)
+    regions = {}
+    variations = {}
+    for gene in gene_names:
+        region = f"{gene};;1;;X{len(regions):05d}"
+        regions[region] = {"type": "seq_region", "name": gene, "key": region, "ref_database": ["PointFinder"]}
+        for i, (ref, pos, alt, resistance) in enumerate(mutations[gene]):
+            key = f"{region}_{pos}_{ref.lower()}_{alt.lower()}_{i}"
+            phenotypes = [] if resistance == "Unknown" else [r.strip().lower() for r in resistance.split(",")]
+            variations[key] = {"type": "seq_variation", "key": key, "seq_var": f"p.{ref}{pos}{alt}", "ref_aa": ref.lower(),
+                               "var_aa": alt.lower(), "ref_start_pos": pos, "seq_regions": [region], "phenotypes": phenotypes}
+    with open(path, "w") as outf_h:
+        json.dump({"type": "software_result", "software_name": "ResFinder", "seq_regions": regions, "seq_variations": variations}, outf_h)
+
+
+def write_phenotypes(path, n_genes, seed=0):
+    """
+    ResFinder phenotypes.txt covering the synthetic genes
+    """
+    with open(path, "w", newline="") as outf_h:
+        writer = csv.writer(outf_h, delimiter="\t", lineterminator="\n")
+        writer.writerow(["Gene_accession no.", "Class", "Phenotype", "PMID", "Mechanism of resistance", "Notes", "Required_gene"])
+        for i, (name, family) in enumerate(synthetic_genes(max(n_genes, 1), seed)):
+            writer.writerow([f"{name}_1_AY{i:06d}", family[1].capitalize(), family[4], "1", "", "", ""])
+
+
+def write_fixtures(directory, n_hits, seed=0):
+    """
+    writes outputs of all tools and the phenotype table for n_hits hits per tool
+    return: dict of paths: NCBIAMRFinder, CARD-RGI, ResFinder, phenotype
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {"NCBIAMRFinder": os.path.join(directory, "NCBIAMRFinder.tsv"),
+             "CARD-RGI": os.path.join(directory, "CARD-RGI.txt"),
+             "ResFinder": os.path.join(directory, "ResFinder"),
+             "phenotype": os.path.join(directory, "phenotypes.txt")}
+    write_amrfinder(paths["NCBIAMRFinder"], n_hits, seed)
+    write_rgi(paths["CARD-RGI"], n_hits, seed)
+    write_resfinder(paths["ResFinder"], n_hits, seed)
+    write_phenotypes(paths["phenotype"], max(n_hits // 2, 1), seed)
+    return paths
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import re
+import csv
+import json
+import fcntl
+import hashlib
+import argparse
+from collections import OrderedDict
+from tempfile import NamedTemporaryFile
+
+from abr_combine.util import EXT_DIR
+
+default_names_file = os.path.join(os.path.expanduser("~"), ".cache", "abr_combine", "gene_names.tsv")
+default_max_names = 200000
+
+#### gene name normalisation to the merge key "mo" ####
+
+# gene names from CARD-RGI: often text with starting with: "Species name genename ... "
+regex_species_gene = re.compile(r"^[A-Z][a-z-]* [a-z]* ([A-Za-z0-9-]*)")
+# gene names from CARD-RGI: often text with starting with: "Long description \(genename\) ... "
+regex_description_gene = re.compile(r"^.* \(([A-Za-z0-9-]*)\)")
+# "delta" suffix from AMRFinderPlus and CARD-RGI
+regex_delta = re.compile(r"delta[0-9]*$")
+# "-number" suffix when multiple alleles of a gene are identifyable
+regex_allele = re.compile(r"-*[0-9]*$")
+
+# stored with the dictionary, computed merge keys of another normaliser are not reused. increase when normalise_gene_name changes
+normaliser_version = "1-" + hashlib.sha256(json.dumps([r.pattern for r in [regex_species_gene, regex_description_gene, regex_delta, regex_allele]]).encode()).hexdigest()[:12]
+
+
+def normalise_gene_name(name):
+    """
+    maps a gene name reported by any tool to the merge key "mo"
+    """
+    if not isinstance(name, str):
+        return float("nan")
+
+    m = regex_species_gene.search(name) or regex_description_gene.search(name)
+    if m:
+        mo = m.group(1)
+    else:
+        # remove "bla" prefix from ResFinder and AMRFinderPlus to merge with CARD-RGI bla-genes
+        mo = regex_delta.sub("", name.replace("bla",""))
+
+    # set all to lowercase (merging is case sensitive)
+    return regex_allele.sub("", mo).lower()
+
+
+class GeneNameCache:
+    """
+    memoized normalise_gene_name with a bounded least recently used dictionary that can be stored on disk.
+    overrides replace the computed merge key and are never evicted
+    """
+
+    def __init__(self, max_names=default_max_names):
+        self.max_names = max_names
+        self.names = OrderedDict()
+        self.overrides = {}
+        # overrides set (name -> mo) or removed (name -> None) since the last save
+        self.override_changes = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def normalise(self, name):
+        if not isinstance(name, str):
+            return float("nan")
+        if name in self.overrides:
+            self.hits += 1
+            return self.overrides[name]
+        mo = self.names.get(name)
+        if mo is not None:
+            self.hits += 1
+            self.names.move_to_end(name)
+            return mo
+
+        self.misses += 1
+        mo = normalise_gene_name(name)
+        self.add(name, mo)
+        self.dirty = True
+        return mo
+
+    def add(self, name, mo):
+        self.names[name] = mo
+        self.names.move_to_end(name)
+        while len(self.names) > self.max_names:
+            self.names.popitem(last=False)
+
+    def override(self, name, mo):
+        self.overrides[name] = mo
+        self.override_changes[name] = mo
+        self.dirty = True
+
+    def unset(self, name):
+        self.overrides.pop(name, None)
+        self.override_changes[name] = None
+        self.dirty = True
+
+    def overrides_digest(self):
+        return hashlib.sha256(json.dumps(sorted(self.overrides.items())).encode()).hexdigest()
+
+    def preload(self, names):
+        for name in names:
+            if name not in self.names:
+                self.add(name, normalise_gene_name(name))
+        self.dirty = True
+
+    def load(self, path=default_names_file):
+        """
+        reads a dictionary written by save: name, mo, source ("computed" or "override"). computed merge keys are
+        only used if they were written by the same normaliser version
+        """
+        if not os.path.exists(path):
+            return
+        version = None
+        with open(path, "r", newline="") as inf_h:
+            for fields in csv.reader(inf_h, delimiter="\t"):
+                if fields and fields[0] == "name":
+                    version = fields[3].split(":", 1)[-1] if len(fields) > 3 else None
+                    continue
+                if len(fields) < 3:
+                    continue
+                if fields[2] == "override":
+                    self.overrides[fields[0]] = fields[1]
+                elif version == normaliser_version and fields[0] not in self.names:
+                    self.add(fields[0], fields[1])
+
+    def save(self, path=default_names_file):
+        """
+        writes the dictionary if new names were added. the file is read, merged and replaced under an exclusive lock,
+        so entries and overrides written by other processes (batch workers, --set/--unset) are kept
+        """
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path + ".lock", "a") as lock_h:
+            fcntl.flock(lock_h, fcntl.LOCK_EX)
+            on_disk = GeneNameCache(self.max_names)
+            on_disk.load(path)
+            for name, mo in self.names.items():
+                on_disk.add(name, mo)
+            for name, mo in self.override_changes.items():
+                if mo is None:
+                    on_disk.overrides.pop(name, None)
+                else:
+                    on_disk.overrides[name] = mo
+
+            with NamedTemporaryFile("w", dir=directory, delete=False, newline="") as outf_h:
+                writer = csv.writer(outf_h, delimiter="\t", lineterminator="\n")
+                writer.writerow(["name", "mo", "source", f"normaliser:{normaliser_version}"])
+                for name, mo in on_disk.overrides.items():
+                    writer.writerow([name, mo, "override"])
+                for name, mo in on_disk.names.items():
+                    writer.writerow([name, mo, "computed"])
+            os.replace(outf_h.name, path)
+        self.override_changes = {}
+        self.dirty = False
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.names), "overrides": len(self.overrides)}
+
+
+# cache shared by all tools and samples of this process
+gene_names = GeneNameCache()
+
+
+#### functions that might be called from outside ####
+
+def database_gene_names(card_index=os.path.join(EXT_DIR, "card", "aro_index.tsv")):
+    """
+    gene names of the ResFinder database (fasta headers) and, if available, the CARD aro_index.tsv
+    """
+    names = []
+    resfinder_db = os.path.join(EXT_DIR, "db_resfinder")
+    if os.path.isdir(resfinder_db):
+        for dbfile in sorted(os.listdir(resfinder_db)):
+            if not dbfile.endswith(".fsa"):
+                continue
+            with open(os.path.join(resfinder_db, dbfile), "r") as inf_h:
+                for line in inf_h:
+                    if line.startswith(">"):
+                        names.append(line[1:].strip().split("_")[0])
+    if os.path.exists(card_index):
+        with open(card_index, "r", newline="") as inf_h:
+            for row in csv.DictReader(inf_h, delimiter="\t"):
+                if row.get("ARO Name"):
+                    names.append(row["ARO Name"])
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit and override the gene name to merge key (mo) mapping")
+    parser.add_argument("-f", "--file", dest="names_file", help=f"gene name dictionary [{default_names_file}]", default=default_names_file)
+    parser.add_argument("--preload", dest="preload", help="add all gene names of the ResFinder (and CARD) databases", action="store_true", default=False)
+    parser.add_argument("--set", dest="set", help="override the merge key of a gene name", nargs=2, metavar=("NAME", "MO"), action="append", default=[])
+    parser.add_argument("--unset", dest="unset", help="remove override of a gene name", metavar="NAME", action="append", default=[])
+    parser.add_argument("--show", dest="show", help="print the merge key of gene names", metavar="NAME", nargs="+", default=[])
+    args = parser.parse_args()
+
+    gene_names.load(args.names_file)
+    if args.preload:
+        gene_names.preload(database_gene_names())
+    for name, mo in args.set:
+        gene_names.override(name, mo)
+    for name in args.unset:
+        gene_names.unset(name)
+    for name in args.show:
+        source = "override" if name in gene_names.overrides else "computed"
+        sys.stdout.write(f"{name}\t{gene_names.normalise(name)}\t{source}\n")
+    gene_names.save(args.names_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import os
+import gzip
+import time
+import pickle
+from tempfile import NamedTemporaryFile
+
+from abr_combine import transform
+
+intermediate_ext = ".abr.pkl.gz"
+intermediate_format = 2
+# format 1 has no tool hits and can only be rescored with the cutoffs it was written with
+supported_formats = [1, 2]
+
+
+#### functions that might be called from outside ####
+
+def write_intermediate(path, result):
+    """
+    stores everything needed to recompute the views and the consensus prediction of a sample (SampleResult) without the tools:
+    the tables of all tools and their hits before the selection of one hit per gene, the merged table after the phenotype join
+    and the phenotypes of the detected genes
+    """
+    data = {"format": intermediate_format, "sample": result.sample, "species": result.species, "label": result.label, "created": time.time(),
+            "methods": list(result.methods), "dfs": list(result.dfs), "df": result.df, "hits": result.hits,
+            "phenotypes": result.phenotypes, "version_df": result.version_df, "cutoffs": transform.default_cutoffs}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(path)), delete=False) as outf_h:
+        with gzip.GzipFile(fileobj=outf_h, mode="wb", compresslevel=3) as gz_h:
+            pickle.dump(data, gz_h, protocol=pickle.HIGHEST_PROTOCOL)
+    os.chmod(outf_h.name, 0o644)
+    os.replace(outf_h.name, path)
+
+
+def read_intermediate(path):
+    with gzip.open(path, "rb") as inf_h:
+        data = pickle.load(inf_h)
+    if data.get("format") not in supported_formats:
+        raise ValueError(f"{path}: unsupported intermediate format {data.get('format')}")
+    return data
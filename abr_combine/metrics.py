@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import resource
+import time
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+
+# ru_maxrss is reported in kilobytes on linux, in bytes on mac os
+RSS_UNIT = 1 if os.uname().sysname == "Darwin" else 1024
+
+
+#### internal functions ####
+
+def peak_rss():
+    """
+    peak rss of the process since its start, includes all earlier stages and samples of batch and service workers
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def current_rss():
+    """
+    current rss of the process, None if /proc is not available (mac os)
+    """
+    try:
+        with open("/proc/self/statm", "r") as inf_h:
+            return int(inf_h.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def prometheus_labels(labels):
+    return ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items())
+
+
+class Metrics:
+    """
+    wall time, cpu time and memory of the python stages and the external tools of one run. stages record the rss
+    at their end and its change during the stage, tools their peak rss
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.tools = []
+        self.start = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss()
+        try:
+            yield self
+        finally:
+            end_rss = current_rss()
+            self.stages.append({"stage": name, "wall_seconds": time.perf_counter() - wall, "cpu_seconds": time.process_time() - cpu,
+                                "rss_bytes": end_rss, "rss_delta_bytes": None if rss is None else end_rss - rss})
+
+    def add_tool(self, tool, wall_seconds, rusage, exit_code):
+        """
+        rusage of the tool subprocess as returned by os.wait4
+        """
+        self.tools.append({"tool": tool, "wall_seconds": wall_seconds, "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+                           "user_seconds": rusage.ru_utime, "system_seconds": rusage.ru_stime,
+                           "peak_rss_bytes": rusage.ru_maxrss * RSS_UNIT, "exit_code": exit_code})
+
+    def to_dict(self):
+        return {"start": self.start, "wall_seconds": time.time() - self.start, "process_peak_rss_bytes": peak_rss(),
+                "stages": self.stages, "tools": self.tools}
+
+    def write_json(self, path, **info):
+        with open(path, "w") as outf_h:
+            json.dump(dict(info, **self.to_dict()), outf_h, indent=1)
+
+
+#### functions that might be called from outside ####
+
+def write_prometheus(path, runs):
+    """
+    writes a textfile for the node exporter textfile collector. runs: list of (labels dict, Metrics.to_dict()),
+    stage and tool times of all runs are summed up per label set
+    """
+    metrics = {}
+    def add(metric, help_text, labels, value):
+        values = metrics.setdefault(metric, (help_text, {}))[1]
+        key = prometheus_labels(labels)
+        values[key] = values.get(key, 0) + value
+
+    for labels, run in runs:
+        add("abr_combine_run_wall_seconds", "Wall time of the runs", labels, run["wall_seconds"])
+        add("abr_combine_runs", "Number of runs", labels, 1)
+        for s in run["stages"]:
+            stage_labels = dict(labels, stage=s["stage"])
+            add("abr_combine_stage_wall_seconds", "Wall time of processing stages", stage_labels, s["wall_seconds"])
+            add("abr_combine_stage_cpu_seconds", "CPU time of processing stages", stage_labels, s["cpu_seconds"])
+        for t in run["tools"]:
+            tool_labels = dict(labels, tool=t["tool"])
+            add("abr_combine_tool_wall_seconds", "Wall time of external tools", tool_labels, t["wall_seconds"])
+            add("abr_combine_tool_cpu_seconds", "CPU time (user and system) of external tools", tool_labels, t["cpu_seconds"])
+            add("abr_combine_tool_failures", "Number of failed tool runs", tool_labels, 1 if t["exit_code"] != 0 else 0)
+    add("abr_combine_process_peak_rss_bytes", "Peak resident memory of the python process since its start", {}, peak_rss())
+    add("abr_combine_last_run_timestamp_seconds", "Time of the last run", {}, time.time())
+
+    with NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(path)), delete=False) as outf_h:
+        for metric, (help_text, values) in metrics.items():
+            outf_h.write(f"# HELP {metric} {help_text}\n# TYPE {metric} gauge\n")
+            for key, value in values.items():
+                outf_h.write(f"{metric}{{{key}}} {value}\n" if key else f"{metric} {value}\n")
+    os.chmod(outf_h.name, 0o644)
+    os.replace(outf_h.name, path)
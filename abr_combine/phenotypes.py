@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import mmap
+import pickle
+from tempfile import NamedTemporaryFile
+import pandas as pd
+
+from abr_combine.util import ROOT_DIR, EXT_DIR, transl_orgn_resfinder
+from abr_combine.transform import read_table
+from abr_combine.genenames import gene_names
+
+INDEX_FILE = os.path.join(ROOT_DIR, "phenotypes.idx")
+
+# index loaded in this process, shared by all samples
+_index = {}
+
+
+#### internal functions ####
+
+def db_version(version_df):
+    """
+    database part of the ResFinder version string, i.e. "acqdb-...;pointdb-..."
+    """
+    versions = {row["toolname"]: row["version"] for i, row in version_df.iterrows()}
+    return ";".join(versions.get("ResFinder", "").split(";")[1:])
+
+
+def read_acquired_phenotypes():
+    phenofile = os.path.join(EXT_DIR, "db_resfinder", "phenotypes.txt")
+    df_pheno = read_table(phenofile, "phenotype", "\t", ",", "Phenotype", "Gene_accession no.", report=["Class"])
+    df_pheno.drop_duplicates("mo", inplace=True)
+    return df_pheno
+
+
+def read_point_phenotypes(pointfinder_dir):
+    point_pheno_file = os.path.join(EXT_DIR, "db_pointfinder", pointfinder_dir, "resistens-overview.txt")
+    df_point_pheno = pd.read_csv(point_pheno_file, sep="\t", header=None, names=["Gene_ID","Gene_name","Codon_pos","Ref_nuc","Ref_codon","Res_codon","Resistance","PMID","Mechanism","Notes","Required_mut"], comment="#")
+
+    # expanding multiple possible Res_codons to multiple rows
+    df_point_pheno["Res_codon"] = df_point_pheno["Res_codon"].str.split(",")
+    df_point_pheno = df_point_pheno.explode("Res_codon")
+
+    # create mergeable resistance gene code
+    pos = df_point_pheno["Ref_codon"] + df_point_pheno["Codon_pos"].astype(int).astype(str) + df_point_pheno["Res_codon"]
+    df_point_pheno["phenotype"] = df_point_pheno["Gene_name"] + "_" + pos
+
+    # create mergeable df structure
+    df_point_pheno["antibiotic_phenotype"] = df_point_pheno["Resistance"]
+    df_point_pheno["mo"] = df_point_pheno["Gene_name"].str.lower() + "_" + pos.str.lower()
+    return df_point_pheno[['antibiotic_phenotype', 'phenotype', 'mo']].drop_duplicates(subset="mo")
+
+
+def pointfinder_dirs():
+    pointfinder_db = os.path.join(EXT_DIR, "db_pointfinder")
+    return [d for d in os.listdir(pointfinder_db) if os.path.isfile(os.path.join(pointfinder_db, d, "resistens-overview.txt"))]
+
+
+def load_index(version, indexfile=INDEX_FILE):
+    """
+    reads the compiled phenotype index with a single memory mapped read. an unreadable index or one pickled
+    by another pandas version is rebuilt from the phenotype tables (if the database version is known)
+    return: index dict or None if no index of this database version is available
+    """
+    if indexfile in _index:
+        index = _index[indexfile]
+    elif os.path.exists(indexfile):
+        try:
+            with open(indexfile, "rb") as inf_h:
+                with mmap.mmap(inf_h.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    index = pickle.loads(mm)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, TypeError, ValueError) as e:
+            sys.stderr.write(f"Phenotype index {indexfile} is not readable ({type(e).__name__}: {e}). Rebuilding it from the phenotype tables\n")
+            return rebuild_index(version, indexfile)
+        if not isinstance(index, dict) or index.get("pandas") != pd.__version__:
+            sys.stderr.write(f"Phenotype index {indexfile} was built with another pandas version. Rebuilding it from the phenotype tables\n")
+            return rebuild_index(version, indexfile)
+        _index[indexfile] = index
+    else:
+        return None
+
+    if version is not None and index["version"] != version:
+        sys.stderr.write(f"Phenotype index {indexfile} was built for {index['version']}, databases are {version}. Reading phenotype tables\n")
+        return None
+    # merge keys of the acquired phenotypes depend on the gene name overrides
+    if index.get("overrides") != gene_names.overrides_digest():
+        sys.stderr.write(f"Phenotype index {indexfile} was built with other gene name overrides. Reading phenotype tables\n")
+        return None
+    return index
+
+
+def rebuild_index(version, indexfile):
+    """
+    build_index for load_index, returns None (phenotype tables are read directly) if the version is unknown or the index cannot be written
+    """
+    if version is None:
+        return None
+    try:
+        index = build_index(version, indexfile)
+    except OSError as e:
+        sys.stderr.write(f"Phenotype index {indexfile} could not be written ({e}). Reading phenotype tables\n")
+        return None
+    _index[indexfile] = index
+    return index
+
+
+#### functions that might be called from outside ####
+
+def build_index(version, indexfile=INDEX_FILE):
+    """
+    compiles the ResFinder phenotypes and the PointFinder resistance overviews of all species into
+    one pickled dict: {"version": ..., "pandas": pandas version, "overrides": digest of the gene name overrides, "acquired": pd.DataFrame,
+    "point": {pointfinder species dir: pd.DataFrame}}. this is meant to be run on setup, version is the database version (see db_version)
+    """
+    index = {"version": version, "pandas": pd.__version__, "overrides": gene_names.overrides_digest(), "acquired": read_acquired_phenotypes(), "point": {}}
+    for pointfinder_dir in pointfinder_dirs():
+        index["point"][pointfinder_dir] = read_point_phenotypes(pointfinder_dir)
+
+    # written to a temporary file and renamed, so concurrent readers never see a partial index
+    with NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(indexfile)), delete=False) as outf_h:
+        pickle.dump(index, outf_h, protocol=pickle.HIGHEST_PROTOCOL)
+    os.chmod(outf_h.name, 0o644)
+    os.replace(outf_h.name, indexfile)
+    _index.pop(indexfile, None)
+    return index
+
+
+def read_phenotypes(species, version=None):
+    """
+    collects the ResFinder phenotypes and, if available for species, the PointFinder phenotypes.
+    uses the compiled index if it matches the database version, otherwise the tables are parsed
+    return: df_pheno: pd.DataFrame mergeable on "mo"
+    """
+    index = load_index(version)
+    df_pheno = index["acquired"] if index else read_acquired_phenotypes()
+
+    pointfinder_species = transl_orgn_resfinder("", species)
+    if pointfinder_species:
+        pointfinder_dir = pointfinder_species.replace(" ","_")
+        if index and pointfinder_dir in index["point"]:
+            df_point_pheno = index["point"][pointfinder_dir]
+        else:
+            df_point_pheno = read_point_phenotypes(pointfinder_dir)
+
+        # append pointfinder phenotype to resfinder phenotypes (antibiotics naming for resistance genes)
+        df_pheno = pd.concat([df_pheno, df_point_pheno])
+
+    return df_pheno
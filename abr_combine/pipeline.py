@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+from tempfile import TemporaryDirectory
+from contextlib import ExitStack
+import pandas as pd
+
+from abr_combine.util import run_tools, shardable, database_paths
+from abr_combine.registry import fingerprint
+from abr_combine.fasta import fasta_input, shard_fasta, default_fast_tmp
+from abr_combine.prescreen import prescreen_fasta, load_index, lost_hits, default_index_dir
+from abr_combine.cache import file_digest, cache_key, restore_result, store_result, evict, default_cache_size
+from abr_combine.transform import read_amr, combine_tables, write_table
+from abr_combine.predict import SEQSPHERE_TEMPLATE_NAMES
+from abr_combine.result import SampleResult
+from abr_combine.metrics import Metrics
+from abr_combine.intermediate import write_intermediate
+from abr_combine.store import append_sample
+from abr_combine.excel import write_excel
+from abr_combine.records import sample_record, write_json, append_ndjson
+
+
+#### internal functions ####
+
+def run_input(input_file, species, methods, outputfiles, tmpdir, threads, timeout, cachedir, cache_size, versions, metrics, shards):
+    """
+    runs the tools without cached result on the uncompressed input_file with output into tmpdir and reads the tables of all methods
+    """
+    methods = list(methods)
+    cached = []
+    keys = {}
+    if cachedir and methods:
+        digest = file_digest(input_file)
+        for tool in methods:
+            keys[tool] = cache_key(digest, tool, species, (versions or {}).get(tool, "unknown"), fingerprint(database_paths(tool)))
+            if restore_result(cachedir, keys[tool], tmpdir, tool):
+                cached.append(tool)
+
+    shard_files, contigs = None, None
+    if shards > 1 and any(m in shardable and m not in cached for m in methods):
+        with metrics.stage("sharding"):
+            shard_files, contigs = shard_fasta(input_file, os.path.join(tmpdir, "shards"), shards)
+
+    # run tools and update output to methods that did not fail
+    with metrics.stage("run_tools"):
+        finished = run_tools([m for m in methods if m not in cached], input_file, species, tmpdir, threads, timeout, metrics, shard_files, contigs)
+    if cachedir and finished:
+        for tool in finished:
+            store_result(cachedir, keys[tool], tmpdir, tool)
+        evict(cachedir, cache_size)
+    methods = [m for m in methods if m in cached or m in finished]
+    for tool in outputfiles:
+        methods.append(tool)
+
+    # read files for each successful method and store df output
+    dfs = []
+    hits = {}
+    with metrics.stage("read_amr"):
+        for tool in list(methods):
+            for output_file in [outputfiles.get(tool, f"{tmpdir}/{tool}"),f"{tmpdir}/{tool}.txt"]:
+                if os.path.exists(output_file):
+                    try:
+                        dfs.append(read_amr(output_file, tool, hits))
+                    except pd.errors.EmptyDataError:
+                        sys.stderr.write(f"{output_file} is empty\n")
+                        methods.remove(tool)
+    return methods, dfs, hits
+
+
+#### functions that might be called from outside ####
+
+def run_sample(input_fasta, species, methods, outputfiles, tmpdir, threads, timeout=None, cachedir=None, cache_size=default_cache_size, versions=None,
+               fast_tmp=default_fast_tmp, metrics=None, shards=1, prescreen=None, prescreen_index=default_index_dir):
+    """
+    runs the selected tools on one input fasta and reads their output. compressed input is decompressed once
+    (preferably into the memory backed fast_tmp) and shared by all tools. if cachedir is given,
+    tool results are reused from and stored into the result cache (versions: dict toolname -> version).
+    shards > 1 splits large inputs into contig shards that the shardable tools (util.shardable) process in parallel.
+    prescreen "on" passes only contigs sharing k-mers with the ResFinder/PointFinder databases to the tools
+    (index stored in prescreen_index), "check" runs the tools on the complete and the prescreened input,
+    reports the hits lost by the prescreen and returns the results of the complete input
+    return: methods: list of tools with output, dfs: list of pd.DataFrame per method, hits: dict tool -> hits before the selection of one hit per gene (see read_amr)
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    with TemporaryDirectory(dir=tmpdir) as tmpdir, ExitStack() as stack:
+        with metrics.stage("decompression"):
+            input_file = stack.enter_context(fasta_input(input_fasta, tmpdir, fast_tmp))
+
+        if not prescreen or not input_file:
+            return run_input(input_file, species, methods, outputfiles, tmpdir, threads, timeout, cachedir, cache_size, versions, metrics, shards)
+
+        with metrics.stage("prescreen"):
+            screened_file = os.path.join(tmpdir, "prescreened.fasta")
+            prescreen_fasta(input_file, screened_file, load_index(prescreen_index))
+        if prescreen != "check":
+            return run_input(screened_file, species, methods, outputfiles, tmpdir, threads, timeout, cachedir, cache_size, versions, metrics, shards)
+
+        screened_dir = os.path.join(tmpdir, "prescreened")
+        os.makedirs(screened_dir)
+        screened_methods, screened_dfs, screened_hits = run_input(screened_file, species, methods, outputfiles, screened_dir, threads, timeout, cachedir,
+                                                                  cache_size, versions, metrics, shards)
+        methods, dfs, hits = run_input(input_file, species, methods, outputfiles, tmpdir, threads, timeout, cachedir, cache_size, versions, metrics, shards)
+        lost = lost_hits(methods, dfs, screened_methods, screened_dfs)
+        sys.stdout.write(f"Prescreen recall check: {len(lost)} of {sum(len(df) for df in dfs)} hits lost\n")
+        for tool, gene in lost:
+            sys.stdout.write(f"Lost by prescreen: {tool}\t{gene}\n")
+    return methods, dfs, hits
+
+
+def analyse_sample(dfs, methods, df_pheno, label=None, metrics=None, sample=None, species=None, version_df=None, hits=None):
+    """
+    merges tool results with phenotypes and creates the output views. hits: tool hits of read_amr, stored in intermediates
+    return: SampleResult
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    with metrics.stage("combine_tables"):
+        df = combine_tables(dfs, on="mo")
+
+    with metrics.stage("phenotype_merge"):
+        df = df.merge(df_pheno, on="mo", how="left", suffixes=["_o",""])
+        df.drop("phenotype", axis=1, inplace=True)
+
+    result = SampleResult(sample, species, methods, dfs, df, df_pheno, version_df, label, hits)
+    score_sample(result, metrics)
+    return result
+
+
+def score_sample(result, metrics=None):
+    """
+    computes the output views and the consensus prediction of result, so their time is recorded in metrics
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    with metrics.stage("views"):
+        result.view1, result.view2
+    with metrics.stage("consensus"):
+        result.consensus
+    return result
+
+
+def write_outputs(result, outtable=None, excelfile=None, specfile=None, metrics=None, jsonfile=None, ndjsonfile=None):
+    """
+    writes the views (csv, to stdout if no outtable is given), the excel report, the SeqSphere .spec file and
+    the json record of result (as json document into jsonfile and as one line appended to ndjsonfile)
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    with metrics.stage("write_csv"):
+        if not outtable:
+            write_table(result.view1, sys.stdout)
+            write_table(result.view2, sys.stdout)
+        else:
+            write_table(result.view1, outtable +".view1.csv")
+            write_table(result.view2, outtable +".view2.csv")
+
+    if excelfile:
+        with metrics.stage("write_xlsx"):
+            sheets = [("consensus_prediction", result.consensus), ("view1_antibiotics", result.view1), ("view2_genes", result.view2)]
+            sheets.extend((f"raw_{m}", d) for m, d in result.raw_tables())
+            sheets.append(("versions", result.version_df))
+            write_excel(excelfile, sheets)
+
+    if specfile:
+        with metrics.stage("write_spec"):
+            versions = result.versions
+            drugs = result.resistant_drugs
+            print(drugs)
+            with open(specfile, "w") as outf_h:
+                for drug in drugs:
+                    outf_h.write(f"ef.Antimicrobial.{drug.replace('+', '_').replace(' ', '_').lower()}=Resistant\n")
+                for m in result.view_methods:
+                    version_tag = SEQSPHERE_TEMPLATE_NAMES.get(m)
+                    if version_tag:
+                        outf_h.write(f"ef.Antimicrobial.{version_tag}={versions[m]}\n")
+                outf_h.write(f"ef.Antimicrobial.script_version={versions['Main']}\n")
+
+    if jsonfile or ndjsonfile:
+        with metrics.stage("write_json"):
+            record = sample_record(result)
+            if jsonfile:
+                write_json(jsonfile, record)
+            if ndjsonfile:
+                append_ndjson(ndjsonfile, record)
+
+
+def process_sample(input_fasta, species, methods, outputfiles, df_pheno, version_df, tmpdir="/tmp", threads=1, timeout=None,
+                   outtable=None, excelfile=None, specfile=None, label=None, cachedir=None, cache_size=default_cache_size,
+                   fast_tmp=default_fast_tmp, metrics=None, intermediate=None, sample=None, store=None, shards=1,
+                   prescreen=None, prescreen_index=default_index_dir, jsonfile=None, ndjsonfile=None):
+    """
+    complete analysis of one sample: run tools, combine results and write all requested outputs.
+    stage timings and tool resource usage are recorded into metrics (abr_combine.metrics.Metrics) if given.
+    intermediate: file to store the tool tables and the merged table for rescoring (see abr_combine.rescore)
+    store: sqlite results store the consensus, view1 and the raw hits are appended to (see abr_combine.store)
+    shards: maximal number of contig shards of the input that the shardable tools (util.shardable) process in parallel
+    prescreen: "on" or "check" to run the tools only on contigs with database k-mers (see run_sample)
+    return: exit code (0 on success, 1 if no tool output was available)
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    versions = {row["toolname"]: row["version"] for i, row in version_df.iterrows()}
+    methods, dfs, hits = run_sample(input_fasta, species, methods, outputfiles, tmpdir, threads, timeout, cachedir, cache_size, versions, fast_tmp, metrics,
+                                    shards, prescreen, prescreen_index)
+
+    if len(dfs) == 0:
+        print("ERROR: no tool executable or no output available")
+        return 1
+
+    result = analyse_sample(dfs, methods, df_pheno, label, metrics, sample or label, species, version_df, hits)
+    if intermediate:
+        with metrics.stage("write_intermediate"):
+            write_intermediate(intermediate, result)
+    if store:
+        with metrics.stage("write_store"):
+            append_sample(store, result)
+    write_outputs(result, outtable, excelfile, specfile, metrics, jsonfile, ndjsonfile)
+    return 0
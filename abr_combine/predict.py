@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 method_weights = {"NCBIAMRFinder": 1.,
@@ -12,26 +13,96 @@ SEQSPHERE_TEMPLATE_NAMES = {"NCBIAMRFinder": "amrfinder_version",
                             "ResFinder": "resfinder_version",
                             }
 
+#### internal functions ####
+
+def weight_matrix(tools, weights):
+    """
+    weights: one dict tool -> weight or a list of them
+    return: array (settings, tools), tools without weight get 1
+    """
+    if isinstance(weights, dict):
+        weights = [weights]
+    return np.array([[w.get(t, 1.) for t in tools] for w in weights], dtype=float).reshape(len(weights), len(tools))
+
+
+def tool_scores(tiers):
+    """
+    unweighted score of each call, 0 for tools without call
+    """
+    scores = max_single_score - np.asarray(tiers, dtype=float)
+    scores[np.isnan(scores)] = 0
+    return scores
+
+
+#### functions that might be called from outside ####
+
+def stack_views(views, tools=None):
+    """
+    stacks the color tiers of view1 frames (by antibiotic) of several samples
+    tools: tool axis, default: tools of all views in order of appearance
+    return: tiers (samples, antibiotics, tools) with nan for no call, antibiotics (union in order of appearance), tools,
+            ran (samples, tools) True for tools with a color column in the view of the sample
+    """
+    columns = [[c for c in view.columns if c.startswith("color_")] for view in views]
+    if tools is None:
+        tools = list(dict.fromkeys(c.split("_")[1] for cols in columns for c in cols))
+    antibiotics = list(dict.fromkeys(a for view in views for a in view.index))
+    positions = {a: i for i, a in enumerate(antibiotics)}
+    tool_pos = {t: i for i, t in enumerate(tools)}
+
+    tiers = np.full((len(views), len(antibiotics), len(tools)), np.nan)
+    ran = np.zeros((len(views), len(tools)), dtype=bool)
+    for n, (view, cols) in enumerate(zip(views, columns)):
+        rows = [positions[a] for a in view.index]
+        for c in cols:
+            t = tool_pos.get(c.split("_")[1])
+            if t is not None:
+                tiers[n, rows, t] = view[c].to_numpy(dtype=float)
+                ran[n, t] = True
+    return tiers, antibiotics, tools, ran
+
+
+def sweep_consensus(tiers, tools, weights=None, min_scores=None, ran=None):
+    """
+    consensus prediction of all samples for several settings in one pass
+    tiers: array (samples, antibiotics, tools) of color tiers, nan for no call
+    weights: list of dicts tool -> weight [method_weights], min_scores: list of cutoffs relative to max_single_score [min_prediction_score]
+    ran: (samples, tools) tools that ran per sample, the mean is taken over these [all tools]
+    return: scores (weights, samples, antibiotics), calls (weights, min_scores, samples, antibiotics)
+    """
+    tiers = np.asarray(tiers, dtype=float)
+    w = weight_matrix(tools, method_weights if weights is None else weights)
+    cutoffs = np.atleast_1d(np.asarray(min_prediction_score if min_scores is None else min_scores, dtype=float))
+
+    if ran is None:
+        counts = np.full(tiers.shape[0], tiers.shape[2], dtype=float)
+    else:
+        ran = np.asarray(ran, dtype=bool)
+        tiers = np.where(ran[:, None, :], tiers, np.nan)
+        counts = ran.sum(axis=1).astype(float)
+    # weighted sum over the tools of every sample and setting, then the mean over the tools that ran
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.einsum("nat,wt->wna", tool_scores(tiers), w) / counts[None, :, None]
+    calls = scores[:, None] > (max_single_score * cutoffs)[None, :, None, None]
+    return scores, calls
+
+
+def predict_consensus_batch(tiers, tools, weights=None, min_score=None, ran=None):
+    """
+    consensus prediction of all samples with one setting, see sweep_consensus
+    weights: dict tool -> weight [method_weights], min_score: cutoff relative to max_single_score [min_prediction_score]
+    return: scores (samples, antibiotics), calls (samples, antibiotics)
+    """
+    scores, calls = sweep_consensus(tiers, tools, None if weights is None else [weights], None if min_score is None else [min_score], ran)
+    return scores[0], calls[0, 0]
+
+
 def predict_consensus(df):
 
     if df.empty:
         return(pd.DataFrame(columns=["Mean weighted score","Above resistance cutoff"]))
-    if "mo" in df.columns:
-        df.set_index("mo")
-    else:
-        df.set_index(df.columns[0])
-
-    df_scores = df[[c for c in df.columns if c.startswith("color_")]].copy()
-    df_scores.columns = [c.split("_")[1] for c in df_scores.columns]
-    for c in df_scores.columns:
-        weight = method_weights.get(c, 1.)
-        df_scores[c] = (max_single_score - df_scores[c]) * weight
-   
-    df_scores.fillna(value=0, inplace=True)
-    df_scores.replace(r'^\s*$', 0, regex=True, inplace=True)
-    mean_score = df_scores.mean(axis = 1, skipna=False)
-    pred = (mean_score > max_single_score * min_prediction_score)
-    df = pd.concat([mean_score, pred], axis=1)
-    df.columns = ["Mean weighted score","Above resistance cutoff"]
-    return df #pd.DataFrame([mean_score, pred], columns=["Mean weighted score","Above resistance cutoff"])
-    
+
+    color_cols = [c for c in df.columns if c.startswith("color_")]
+    tiers = df[color_cols].to_numpy(dtype=float)[None]
+    scores, calls = predict_consensus_batch(tiers, [c.split("_")[1] for c in color_cols])
+    return pd.DataFrame({"Mean weighted score": scores[0], "Above resistance cutoff": calls[0]}, index=df.index)
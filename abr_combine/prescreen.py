@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import hashlib
+import json
+from tempfile import NamedTemporaryFile
+import numpy as np
+
+from abr_combine import util
+from abr_combine.registry import fingerprint
+from abr_combine.cache import default_index_dir
+
+# k-mer length, 2 bits per base fit into one uint32
+k = 16
+
+db_extensions = [".fsa", ".fasta", ".fa", ".fna"]
+
+# base -> 2 bit code, everything else is 4 and breaks k-mers
+base_codes = np.full(256, 4, dtype=np.uint8)
+for i, bases in enumerate(["Aa", "Cc", "Gg", "Tt"]):
+    for base in bases:
+        base_codes[ord(base)] = i
+
+# indexes loaded in this process by their digest
+_indexes = {}
+
+
+#### internal functions ####
+
+def db_files(ext_dir):
+    """
+    sequence files of the ResFinder database and the PointFinder genes of all species
+    """
+    files = []
+    for db in ["db_resfinder", "db_pointfinder"]:
+        for root, dirs, filenames in os.walk(os.path.join(ext_dir, db)):
+            dirs.sort()
+            files.extend(os.path.join(root, f) for f in sorted(filenames) if any(f.endswith(ext) for ext in db_extensions))
+    return files
+
+
+def fasta_sequences(path):
+    """
+    yields (header line, sequence) of all records, header lines include the newline
+    """
+    header = None
+    seq = []
+    with open(path, "rb") as inf_h:
+        for line in inf_h:
+            if line.startswith(b">"):
+                if header is not None:
+                    yield header, b"".join(seq)
+                header = line
+                seq = []
+            else:
+                seq.append(line.strip())
+    if header is not None:
+        yield header, b"".join(seq)
+
+
+def canonical_kmers(seq):
+    """
+    k-mers of seq without ambiguous bases as uint32, the smaller of the k-mer and its reverse complement
+    """
+    codes = base_codes[np.frombuffer(seq, dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint32)
+    # number of ambiguous bases in each window
+    ambiguous = np.concatenate([[0], np.cumsum(codes > 3)])
+    valid = ambiguous[k:] - ambiguous[:n] == 0
+    codes = np.minimum(codes, 3).astype(np.uint32)
+    forward = np.zeros(n, dtype=np.uint32)
+    reverse = np.zeros(n, dtype=np.uint32)
+    for j in range(k):
+        forward = (forward << np.uint32(2)) | codes[j:j + n]
+        reverse |= (np.uint32(3) - codes[j:j + n]) << np.uint32(2 * j)
+    return np.minimum(forward, reverse)[valid]
+
+
+def build_index(files):
+    kmers = [canonical_kmers(seq) for path in files for header, seq in fasta_sequences(path)]
+    return np.unique(np.concatenate(kmers)) if kmers else np.zeros(0, dtype=np.uint32)
+
+
+def shared_kmers(seq, index):
+    kmers = canonical_kmers(seq)
+    if len(index) == 0 or len(kmers) == 0:
+        return 0
+    pos = np.minimum(np.searchsorted(index, kmers), len(index) - 1)
+    return int(np.count_nonzero(index[pos] == kmers))
+
+
+#### functions that might be called from outside ####
+
+def load_index(index_dir=default_index_dir, ext_dir=None):
+    """
+    sorted array of the canonical k-mers of the ResFinder and PointFinder databases. the index is rebuilt
+    when a database file changes and stored in index_dir (not stored if index_dir is None)
+    """
+    files = db_files(ext_dir or util.EXT_DIR)
+    digest = hashlib.sha256(json.dumps([k, fingerprint(files)]).encode()).hexdigest()
+    if digest in _indexes:
+        return _indexes[digest]
+
+    path = os.path.join(index_dir, f"k{k}_{digest[:16]}.npy") if index_dir else None
+    if path and os.path.exists(path):
+        index = np.load(path)
+    else:
+        index = build_index(files)
+        sys.stdout.write(f"Built prescreen index of {len(files)} database files: {len(index)} {k}-mers\n")
+        if path:
+            os.makedirs(index_dir, exist_ok=True)
+            with NamedTemporaryFile("wb", dir=index_dir, delete=False) as outf_h:
+                np.save(outf_h, index)
+            os.chmod(outf_h.name, 0o644)
+            os.replace(outf_h.name, path)
+    _indexes[digest] = index
+    return index
+
+
+def prescreen_fasta(input_file, outfile, index, min_shared=1):
+    """
+    writes the contigs of input_file that share at least min_shared k-mers with the database index to outfile
+    return: number of contigs kept, number of contigs
+    """
+    kept = 0
+    total = 0
+    with open(outfile, "wb") as outf_h:
+        for header, seq in fasta_sequences(input_file):
+            total += 1
+            if shared_kmers(seq, index) >= min_shared:
+                kept += 1
+                outf_h.write(header)
+                outf_h.write(seq + b"\n")
+    sys.stdout.write(f"Prescreen: {kept} of {total} contigs share {k}-mers with the databases\n")
+    return kept, total
+
+
+def lost_hits(methods, dfs, screened_methods, screened_dfs):
+    """
+    hits of the complete input that are missing in the results of the prescreened input
+    return: list of (tool, gene)
+    """
+    screened = dict(zip(screened_methods, screened_dfs))
+    lost = []
+    for tool, df in zip(methods, dfs):
+        missing = df[~df["mo"].isin(screened[tool]["mo"])] if tool in screened else df
+        lost.extend((tool, gene) for gene in missing[tool])
+    return lost
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import fcntl
+import numpy as np
+
+from abr_combine.predict import method_weights, max_single_score
+from abr_combine.transform import colors
+
+record_format = 1
+
+# encoder of the json and ndjson output, missing values have to be None
+encoder = json.JSONEncoder(ensure_ascii=False, allow_nan=False)
+
+
+#### internal functions ####
+
+def plain(value):
+    """
+    python value of a table cell, None for missing values
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+        return None if isinstance(value, float) and np.isnan(value) else value
+    return value
+
+
+def split_names(value, sep=","):
+    value = plain(value)
+    if value is None:
+        return []
+    return [v.strip() for v in str(value).split(sep) if v.strip()]
+
+
+def tool_call(tool, genes, tier):
+    tier = plain(tier)
+    call = {"tool": tool, "genes": split_names(genes), "tier": None, "color": None, "score": None}
+    if tier is not None:
+        call.update({"tier": int(tier), "color": colors[int(tier)], "score": (max_single_score - tier) * method_weights.get(tool, 1.)})
+    return call
+
+
+def tool_calls(row, tools):
+    return [tool_call(tool, row[tool], row.get(f"color_{tool}")) for tool in tools if split_names(row[tool])]
+
+
+#### functions that might be called from outside ####
+
+def sample_record(result):
+    """
+    everything the views, the consensus prediction and the versions of a sample (SampleResult) contain
+    as plain python types: per antibiotic the tool calls with their color tier and score and per gene the tool calls
+    """
+    view1 = result.view1
+    view2 = result.view2
+    tools1 = [c for c in view1.columns if not c.startswith("color_")]
+    tools2 = [c for c in view2.columns if c in result.view_methods]
+    return {"format": record_format, "sample": result.sample, "species": result.species, "label": result.label,
+            "versions": {k: plain(v) for k, v in result.versions.items()},
+            "consensus": [{"antibiotic": drug, "score": plain(row["Mean weighted score"]), "resistant": bool(row["Above resistance cutoff"])}
+                          for drug, row in result.consensus.iterrows()],
+            "antibiotics": [{"antibiotic": drug, "calls": tool_calls(row, tools1)} for drug, row in view1.iterrows()],
+            "genes": [{"class": plain(row.get("Class")), "predicted_phenotype": split_names(row["predicted phenotype"]), "calls": tool_calls(row, tools2)}
+                      for i, row in view2.iterrows()],
+            }
+
+
+def write_json(path, record):
+    """
+    writes record as one json document, encoded piece by piece
+    """
+    with open(path, "w") as outf_h:
+        for chunk in encoder.iterencode(record):
+            outf_h.write(chunk)
+        outf_h.write("\n")
+
+
+def append_ndjson(path, record):
+    """
+    appends record as one line to path. the line is written under an exclusive lock, so parallel
+    batch workers can append to the same file
+    """
+    line = ("".join(encoder.iterencode(record)) + "\n").encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        while line:
+            line = line[os.write(fd, line):]
+    finally:
+        os.close(fd)
+
+
+def read_ndjson(path):
+    """
+    yields the sample records of an ndjson file
+    """
+    with open(path, "r") as inf_h:
+        for line in inf_h:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import subprocess
+from tempfile import NamedTemporaryFile
+
+default_registry_file = os.path.join(os.path.expanduser("~"), ".cache", "abr_combine", "tools.json")
+
+
+#### internal functions ####
+
+def fingerprint(paths):
+    """
+    modification time and size of all paths, missing paths are recorded as None
+    """
+    stats = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stats.append([path, st.st_mtime_ns, st.st_size])
+        except OSError:
+            stats.append([path, None, None])
+    return stats
+
+
+def git_paths(gitdir):
+    """
+    files and directories of a git repository that change on checkout, commit, fetch and tagging
+    """
+    git = os.path.join(gitdir, ".git")
+    return [git, os.path.join(git, "HEAD"), os.path.join(git, "packed-refs"), os.path.join(git, "refs", "heads"), os.path.join(git, "refs", "tags")]
+
+
+class ToolRegistry:
+    """
+    results of tool probing (executable lookup, version and organism output, git versions) that are only
+    computed again when the fingerprint (path, mtime, size) of the executable, its databases or the repository changes
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.paths = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def cached(self, key, paths, func):
+        """
+        value of func(), reused as long as the files in paths are unchanged. values have to be json serializable
+        """
+        fp = fingerprint(paths)
+        entry = self.entries.get(key)
+        if entry is not None and entry["fingerprint"] == fp:
+            self.hits += 1
+            return entry["value"]
+
+        self.misses += 1
+        value = func()
+        self.entries[key] = {"fingerprint": fp, "value": value}
+        self.dirty = True
+        return value
+
+    def resolve(self, cmd):
+        """
+        absolute path of the executable, raises FileNotFoundError if cmd is not in PATH
+        """
+        if cmd not in self.paths:
+            path = shutil.which(cmd)
+            if path is None:
+                raise FileNotFoundError(cmd)
+            self.paths[cmd] = path
+        return self.paths[cmd]
+
+    def output(self, cmd, args, stderr=False, databases=()):
+        """
+        output of cmd with args, the tool is only executed if the executable changed since the last call.
+        stderr: append stderr to the output, databases: paths of the databases the output depends on (see util.database_paths),
+        the tool is executed again when they change
+        """
+        path = self.resolve(cmd)
+        def run():
+            proc = subprocess.run([path, *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            return {"stdout": proc.stdout.decode(), "stderr": proc.stderr.decode()}
+
+        value = self.cached(" ".join([cmd, *args]), [path, os.path.realpath(path), *databases], run)
+        return value["stdout"] + value["stderr"] if stderr else value["stdout"]
+
+    def git_version(self, gitdir, func):
+        return self.cached(f"git:{os.path.abspath(gitdir)}", git_paths(gitdir), lambda: list(func(gitdir)))
+
+    def clear(self):
+        """
+        forces probing of all tools, e.g. after database updates that do not change the executables
+        """
+        self.entries = {}
+        self.paths = {}
+        self.dirty = True
+
+    def load(self, path=default_registry_file):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r") as inf_h:
+                entries = json.load(inf_h)
+        except ValueError:
+            return
+        for key, entry in entries.items():
+            self.entries.setdefault(key, entry)
+
+    def save(self, path=default_registry_file):
+        """
+        writes the registry if tools were probed, entries on disk written by other processes are kept
+        """
+        if not self.dirty:
+            return
+        on_disk = ToolRegistry()
+        on_disk.load(path)
+        on_disk.entries.update(self.entries)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(path)), delete=False) as outf_h:
+            json.dump(on_disk.entries, outf_h, indent=1)
+        os.replace(outf_h.name, path)
+        self.dirty = False
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+# registry shared by all samples of this process
+registry = ToolRegistry()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import hashlib
+from tempfile import NamedTemporaryFile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from abr_combine import predict, transform
+from abr_combine.pipeline import analyse_sample, write_outputs
+from abr_combine.result import SampleResult
+from abr_combine.transform import reselect_hits, write_table
+from abr_combine.intermediate import read_intermediate, intermediate_ext
+
+manifest_name = "rescore_manifest.json"
+
+# write the manifest after this many rescored samples, so an interrupted run keeps its progress
+manifest_interval = 100
+
+
+#### internal functions ####
+
+def score_params():
+    """
+    all parameters the views and the consensus prediction depend on
+    """
+    return {"cutoffs": transform.default_cutoffs, "method_weights": predict.method_weights,
+            "max_single_score": predict.max_single_score, "min_prediction_score": predict.min_prediction_score}
+
+
+def params_digest(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def file_state(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_manifest(outdir):
+    path = os.path.join(outdir, manifest_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as inf_h:
+        return json.load(inf_h)
+
+
+def save_manifest(outdir, manifest):
+    with NamedTemporaryFile("w", dir=outdir, delete=False) as outf_h:
+        json.dump(manifest, outf_h, indent=1)
+    os.replace(outf_h.name, os.path.join(outdir, manifest_name))
+
+
+def _rescore_sample(path, sample, outdir, exceldir=None, specdir=None):
+    data = read_intermediate(path)
+    methods = data["methods"]
+    if data["cutoffs"] == transform.default_cutoffs:
+        result = SampleResult(sample, data["species"], methods, data["dfs"], data["df"], data["phenotypes"], data["version_df"], data["label"])
+    else:
+        # one hit per gene is selected again from all hits, as in a new run with the current cutoffs
+        hits = data.get("hits") or {}
+        if any(m not in hits for m in methods):
+            raise ValueError(f"{path}: the cutoffs changed and the intermediate has no tool hits to select from (format {data['format']}), rerun the sample")
+        dfs = [reselect_hits(hits[m], m) for m in methods]
+        result = analyse_sample(dfs, methods, data["phenotypes"], data["label"], sample=sample, species=data["species"], version_df=data["version_df"],
+                                hits=hits)
+
+    outputs = {"outtable": os.path.join(outdir, sample)}
+    if exceldir:
+        outputs["excelfile"] = os.path.join(exceldir, sample + ".xlsx")
+    if specdir:
+        outputs["specfile"] = os.path.join(specdir, sample + ".spec")
+    write_table(result.consensus, outputs["outtable"] + ".consensus.csv")
+    write_outputs(result, **outputs)
+    return [outputs["outtable"] + ext for ext in [".view1.csv", ".view2.csv", ".consensus.csv"]] + \
+           [outputs[k] for k in ["excelfile", "specfile"] if k in outputs]
+
+
+#### functions that might be called from outside ####
+
+def rescore_archive(archive, outdir, workers=1, force=False, exceldir=None, specdir=None):
+    """
+    recomputes views and consensus predictions of all intermediates in archive with the current cutoffs and
+    prediction parameters. only samples whose intermediate or parameters changed since the last run
+    (see the manifest in outdir) or whose outputs are missing are processed, unless force is set.
+    exceldir, specdir: output directories for excel and .spec files
+    return: dict sample -> "rescored", "unchanged" or "failed"
+    """
+    for d in [outdir, exceldir, specdir]:
+        if d:
+            os.makedirs(d, exist_ok=True)
+    manifest = load_manifest(outdir)
+    digest = params_digest(score_params())
+    options = {"excel": exceldir, "spec": specdir}
+
+    todo = {}
+    status = {}
+    for filename in sorted(os.listdir(archive)):
+        if not filename.endswith(intermediate_ext):
+            continue
+        sample = filename[:-len(intermediate_ext)]
+        path = os.path.join(archive, filename)
+        entry = manifest.get(sample)
+        if not force and entry and entry["intermediate"] == file_state(path) and entry["params"] == digest and entry["options"] == options \
+                and all(os.path.exists(f) for f in entry["outputs"]):
+            status[sample] = "unchanged"
+        else:
+            todo[sample] = path
+
+    sys.stdout.write(f"Rescoring {len(todo)} of {len(todo) + len(status)} samples\n")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_rescore_sample, path, sample, outdir, exceldir, specdir): sample for sample, path in todo.items()}
+        for n, future in enumerate(as_completed(futures)):
+            sample = futures[future]
+            try:
+                outputs = future.result()
+                manifest[sample] = {"intermediate": file_state(todo[sample]), "params": digest, "options": options, "outputs": outputs}
+                status[sample] = "rescored"
+            except Exception as e:
+                sys.stderr.write(f"Rescoring {sample} failed: {e}\n")
+                manifest.pop(sample, None)
+                status[sample] = "failed"
+            if (n + 1) % manifest_interval == 0:
+                save_manifest(outdir, manifest)
+
+    save_manifest(outdir, manifest)
+    return status
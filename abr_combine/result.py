@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+from abr_combine.transform import view_by_antibiotic, view_by_genes
+from abr_combine.predict import predict_consensus
+
+
+class SampleResult:
+    """
+    tool tables and merged table of one sample with the views and the consensus prediction derived from them.
+    results are immutable: views are computed on first use and shared by all writers, which must not change them
+    """
+    __slots__ = ["_data", "_cache"]
+
+    def __init__(self, sample, species, methods, dfs, df, df_pheno=None, version_df=None, label=None, hits=None):
+        object.__setattr__(self, "_data", {"sample": sample, "species": species, "methods": tuple(m for m in methods if m != "phenotype"),
+                                           "dfs": tuple(dfs), "df": df, "df_pheno": df_pheno, "version_df": version_df, "label": label,
+                                           "hits": hits})
+        object.__setattr__(self, "_cache", {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SampleResult is immutable")
+
+    def _cached(self, name, func):
+        if name not in self._cache:
+            self._cache[name] = func()
+        return self._cache[name]
+
+    sample = property(lambda self: self._data["sample"])
+    species = property(lambda self: self._data["species"])
+    label = property(lambda self: self._data["label"])
+    # tools with output, dfs are their tables in the same order
+    methods = property(lambda self: self._data["methods"])
+    dfs = property(lambda self: self._data["dfs"])
+    # merged table of all tools after the phenotype join
+    df = property(lambda self: self._data["df"])
+    version_df = property(lambda self: self._data["version_df"])
+    # tool -> hits before the selection of one hit per gene (see transform.read_amr), None if not available
+    hits = property(lambda self: self._data["hits"])
+
+    @property
+    def view_methods(self):
+        return list(self.methods) + ["phenotype"]
+
+    @property
+    def phenotypes(self):
+        """
+        phenotypes of the genes found in this sample
+        """
+        df_pheno = self._data["df_pheno"]
+        return self._cached("phenotypes", lambda: df_pheno[df_pheno["mo"].isin(self.df["mo"])])
+
+    def _view(self, func):
+        view = func(self.df, self.view_methods)
+        if self.label:
+            view.index.name = self.label
+        return view
+
+    @property
+    def view1(self):
+        return self._cached("view1", lambda: self._view(view_by_antibiotic))
+
+    @property
+    def view2(self):
+        return self._cached("view2", lambda: self._view(view_by_genes))
+
+    @property
+    def consensus(self):
+        return self._cached("consensus", lambda: predict_consensus(self.view1))
+
+    @property
+    def versions(self):
+        """
+        dict toolname -> version
+        """
+        return self._cached("versions", lambda: dict(zip(self.version_df["toolname"], self.version_df["version"])))
+
+    @property
+    def resistant_drugs(self):
+        consensus = self.consensus
+        return self._cached("resistant_drugs", lambda: consensus[consensus["Above resistance cutoff"]].index)
+
+    def raw_tables(self):
+        """
+        (tool, table) pairs, indexed by the sample label
+        """
+        return [(m, d.rename_axis(self.label) if self.label else d) for m, d in zip(self.methods, self.dfs)]
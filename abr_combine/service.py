@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import time
+import uuid
+import signal
+import socket
+import threading
+import http.client
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+from abr_combine.fasta import sample_name
+
+# the processing modules (abr_combine.batch and the pandas based pipeline) are imported by the server functions only,
+# clients (submit, job_status) start without them
+
+default_host = "127.0.0.1"
+default_port = 8642
+
+# seconds between status requests of a waiting client
+poll_interval = 1.0
+
+# per job options that can be set by the client, all other options are fixed by the server
+job_options = ["label", "outtable", "excelfile", "specfile", "metrics"]
+
+# finished jobs are forgotten after job_ttl seconds, and the oldest ones beyond max_finished_jobs (their output files are kept)
+job_ttl = 7 * 24 * 3600
+max_finished_jobs = 10000
+
+
+#### internal functions ####
+
+class JobQueue:
+    """
+    samples submitted to the service and their state: queued, running, done or failed
+    """
+
+    def __init__(self, executor, options, outdir, workers):
+        self.executor = executor
+        self.options = options
+        self.outdir = outdir
+        self.spooldir = os.path.join(outdir, "uploads")
+        self.workers = workers
+        self.jobs = OrderedDict()
+        self.futures = {}
+        self.lock = threading.Lock()
+        os.makedirs(self.spooldir, exist_ok=True)
+        if options.get("intermediate"):
+            os.makedirs(options["intermediate"], exist_ok=True)
+
+    def submit(self, request, upload=None):
+        """
+        request: dict with sample, species and either fasta (path readable by the server) or the uploaded fasta content.
+        outtable, excelfile and specfile are output directories below outdir (relative to outdir), default: <outdir>/<job id>
+        return: job dict
+        """
+        job_id = uuid.uuid4().hex[:12]
+        sample = request.get("sample") or job_id
+        if os.path.basename(sample) != sample or sample.startswith("."):
+            raise ValueError(f"invalid sample name: {sample}")
+
+        if upload is not None:
+            fasta = os.path.join(self.spooldir, job_id)
+            with open(fasta, "wb") as outf_h:
+                outf_h.write(upload)
+        else:
+            fasta = request.get("fasta")
+            if not fasta or not os.path.isfile(fasta):
+                raise ValueError(f"fasta file not found: {fasta}")
+
+        options = dict(self.options)
+        options["outtable"] = os.path.join(self.outdir, job_id)
+        for key in job_options:
+            if request.get(key):
+                options[key] = self.output_dir(request[key]) if key in ["outtable", "excelfile", "specfile"] and request[key] is not True else request[key]
+        for key in ["excelfile", "specfile"]:
+            if options.get(key) is True:
+                options[key] = options["outtable"]
+        for key in ["outtable", "excelfile", "specfile"]:
+            if options.get(key):
+                os.makedirs(options[key], exist_ok=True)
+
+        job = {"id": job_id, "sample": sample, "species": request.get("species", ""), "fasta": fasta if upload is None else "upload",
+               "status": "queued", "submitted": time.time(), "finished": None, "exit_code": None, "outputs": [], "metrics": None}
+        from abr_combine.batch import submit_sample
+        with self.lock:
+            self.prune()
+            self.jobs[job_id] = job
+            future = submit_sample(self.executor, sample, fasta, job["species"], options)
+            self.futures[job_id] = future
+        future.add_done_callback(lambda f: self.finished(job_id, f, options, upload is not None))
+        return self.status(job_id)
+
+    def output_dir(self, path):
+        """
+        absolute path of a client requested output directory, which must be below outdir
+        """
+        path = os.path.realpath(os.path.join(self.outdir, path))
+        outdir = os.path.realpath(self.outdir)
+        if os.path.commonpath([path, outdir]) != outdir:
+            raise ValueError(f"output directory not below {self.outdir}: {path}")
+        return path
+
+    def prune(self):
+        """
+        removes finished jobs older than job_ttl and the oldest finished jobs beyond max_finished_jobs, call with self.lock held
+        """
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished"] is not None]
+        expired = time.time() - job_ttl
+        for i, job_id in enumerate(finished):
+            if self.jobs[job_id]["finished"] < expired or i < len(finished) - max_finished_jobs:
+                del self.jobs[job_id]
+
+    def finished(self, job_id, future, options, uploaded):
+        job = self.jobs[job_id]
+        try:
+            job["exit_code"], job["metrics"] = future.result()
+        except Exception as e:
+            sys.stderr.write(f"Job {job_id} failed: {e}\n")
+            job["exit_code"] = 1
+        outputs = []
+        for key in ["outtable", "excelfile", "specfile"]:
+            if options.get(key):
+                outputs.extend(os.path.join(options[key], f) for f in sorted(os.listdir(options[key])) if f.startswith(job["sample"] + "."))
+        with self.lock:
+            job["outputs"] = sorted(set(outputs))
+            job["finished"] = time.time()
+            job["status"] = "done" if job["exit_code"] == 0 else "failed"
+            del self.futures[job_id]
+        if uploaded:
+            os.remove(os.path.join(self.spooldir, job_id))
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            future = self.futures.get(job_id)
+            if future is not None and future.running():
+                job["status"] = "running"
+            return dict(job)
+
+    def list(self):
+        return [self.status(job_id) for job_id in list(self.jobs.keys())]
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    GET /health, GET /jobs, GET /jobs/<id>, GET /jobs/<id>/files/<name>,
+    POST /jobs (json request or fasta upload with sample and species as query parameters)
+    """
+
+    def address_string(self):
+        # unix socket connections have no client address
+        return self.client_address[0] if self.client_address else "local"
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        queue = self.server.queue
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == ["health"]:
+            return self.send_json(200, {"status": "ok", "workers": queue.workers, "jobs": len(queue.jobs)})
+        if parts == ["jobs"]:
+            return self.send_json(200, queue.list())
+        job = queue.status(parts[1]) if len(parts) > 1 and parts[0] == "jobs" else None
+        if job is None:
+            return self.send_json(404, {"error": "not found"})
+        if len(parts) == 2:
+            return self.send_json(200, job)
+        files = {os.path.basename(f): f for f in job["outputs"]}
+        if len(parts) == 4 and parts[2] == "files" and parts[3] in files:
+            with open(files[parts[3]], "rb") as inf_h:
+                body = inf_h.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        return self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": "not found"})
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                job = self.server.queue.submit(json.loads(body.decode()))
+            else:
+                request = {k: v[0] for k, v in parse_qs(url.query).items()}
+                job = self.server.queue.submit(request, upload=body)
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        return self.send_json(202, job)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def request(method, path, body=None, headers={}, host=default_host, port=default_port, socket_path=None):
+    conn = UnixHTTPConnection(socket_path) if socket_path else http.client.HTTPConnection(host, port)
+    try:
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode())
+    finally:
+        conn.close()
+
+
+#### functions that might be called from outside ####
+
+def serve(methods, version_df, options, outdir, workers=1, host=default_host, port=default_port, socket_path=None):
+    """
+    runs the job service until SIGTERM or SIGINT. the worker pool, tool registry and the phenotype tables of all
+    PointFinder species stay loaded, samples are processed like in batch mode (options see batch.run_batch).
+    clients can make the server read any fasta it has access to and write outputs below outdir,
+    so only trusted clients should be able to connect (default: localhost, or a UNIX socket with restricted permissions)
+    """
+    from abr_combine.batch import start_pool
+    from abr_combine.phenotypes import pointfinder_dirs
+    species_list = [""] + [d.replace("_", " ") for d in pointfinder_dirs()]
+    with start_pool(methods, version_df, options, workers, species_list) as executor:
+        queue = JobQueue(executor, options, outdir, workers)
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = UnixHTTPServer(socket_path, ServiceHandler)
+            address = socket_path
+        else:
+            server = ThreadingHTTPServer((host, port), ServiceHandler)
+            address = f"http://{host}:{server.server_port}"
+        server.queue = queue
+
+        # warm up the workers before the first job arrives
+        for future in [executor.submit(time.sleep, 0) for i in range(workers)]:
+            future.result()
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        sys.stdout.write(f"Serving {', '.join(methods)} with {workers} workers on {address}\n")
+        sys.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        if socket_path:
+            os.remove(socket_path)
+    return 0
+
+
+def submit(fasta, species="", sample=None, options={}, upload=False, wait=False, host=default_host, port=default_port, socket_path=None):
+    """
+    submits a sample to a running service, options: label, outtable, excelfile, specfile (directories below the outdir of the service,
+    relative paths are relative to it and not to the working directory of the client), metrics.
+    wait: poll until the job has finished
+    return: job dict
+    """
+    connection = {"host": host, "port": port, "socket_path": socket_path}
+    request_data = {key: options[key] for key in job_options if options.get(key)}
+    request_data["species"] = species
+    request_data["sample"] = sample or sample_name(fasta)
+    if upload:
+        with open(fasta, "rb") as inf_h:
+            status, job = request("POST", "/jobs?" + urlencode(request_data), inf_h.read(), {"Content-Type": "application/octet-stream"}, **connection)
+    else:
+        request_data["fasta"] = os.path.abspath(fasta)
+        status, job = request("POST", "/jobs", json.dumps(request_data), {"Content-Type": "application/json"}, **connection)
+    if status != 202:
+        raise ValueError(job.get("error", f"submission failed with status {status}"))
+
+    while wait and job["status"] in ["queued", "running"]:
+        time.sleep(poll_interval)
+        status, job = request("GET", f"/jobs/{job['id']}", **connection)
+    return job
+
+
+def job_status(job_id, host=default_host, port=default_port, socket_path=None):
+    status, job = request("GET", f"/jobs/{job_id}", host=host, port=port, socket_path=socket_path)
+    return job if status == 200 else None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# seconds to wait for other processes writing to the same store
+lock_timeout = 600
+
+schema = """
+CREATE TABLE IF NOT EXISTS samples (sample_id INTEGER PRIMARY KEY, sample TEXT UNIQUE, species TEXT, label TEXT, run_date TEXT, created REAL);
+CREATE TABLE IF NOT EXISTS consensus (sample_id INTEGER, drug TEXT, score REAL, resistant INTEGER);
+CREATE TABLE IF NOT EXISTS view1 (sample_id INTEGER, drug TEXT, tool TEXT, genes TEXT, color INTEGER);
+CREATE TABLE IF NOT EXISTS hits (sample_id INTEGER, tool TEXT, mo TEXT, gene TEXT, antibiotics TEXT, color INTEGER,
+                                 identity REAL, coverage REAL, quality TEXT);
+CREATE INDEX IF NOT EXISTS samples_species ON samples (species);
+CREATE INDEX IF NOT EXISTS samples_run_date ON samples (run_date);
+CREATE INDEX IF NOT EXISTS consensus_sample ON consensus (sample_id);
+CREATE INDEX IF NOT EXISTS consensus_drug ON consensus (drug);
+CREATE INDEX IF NOT EXISTS view1_sample ON view1 (sample_id);
+CREATE INDEX IF NOT EXISTS view1_drug ON view1 (drug);
+CREATE INDEX IF NOT EXISTS hits_sample ON hits (sample_id);
+CREATE INDEX IF NOT EXISTS hits_mo ON hits (mo);
+"""
+
+
+#### internal functions ####
+
+def connect(path):
+    con = sqlite3.connect(path, timeout=lock_timeout)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(schema)
+    return con
+
+
+def none_if_nan(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+
+def view1_rows(sample_id, view1):
+    rows = []
+    tools = [c for c in view1.columns if not c.startswith("color_")]
+    for drug, row in view1.iterrows():
+        for tool in tools:
+            genes = none_if_nan(row[tool])
+            if genes is None or genes == "":
+                continue
+            color = none_if_nan(row.get(f"color_{tool}"))
+            rows.append((sample_id, str(drug), tool, str(genes), None if color is None else int(color)))
+    return rows
+
+
+def hit_rows(sample_id, dfs, methods):
+    rows = []
+    for tool, df in zip(methods, dfs):
+        for i, row in df.iterrows():
+            color = none_if_nan(row.get(f"color_{tool}"))
+            rows.append((sample_id, tool, none_if_nan(row.get("mo")), none_if_nan(row.get(tool)), none_if_nan(row.get(f"antibiotic_{tool}")),
+                         None if color is None else int(color), none_if_nan(row.get("identity")), none_if_nan(row.get("coverage")),
+                         none_if_nan(row.get("quality"))))
+    return rows
+
+
+def sample_filter(species=None, drugs=None, since=None, until=None, drug_column=None):
+    """
+    sql condition and parameters for the selection of samples (and drugs, if the queried table has a drug_column)
+    """
+    conditions = []
+    params = []
+    if species:
+        conditions.append("samples.species = ?")
+        params.append(species)
+    if since:
+        conditions.append("samples.run_date >= ?")
+        params.append(since)
+    if until:
+        conditions.append("samples.run_date <= ?")
+        params.append(until)
+    if drugs and drug_column:
+        conditions.append(f"{drug_column} IN ({','.join('?' * len(drugs))})")
+        params.extend(drugs)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def sample_matrix(df, value):
+    """
+    drugs x samples matrix in order of appearance
+    """
+    samples = pd.unique(df["sample"])
+    drugs = pd.unique(df["drug"])
+    df = df.drop_duplicates(["drug", "sample"])
+    df = df.pivot(index="drug", columns="sample", values=value).reindex(index=drugs, columns=samples)
+    return df.rename_axis(index=None, columns=None)
+
+
+#### functions that might be called from outside ####
+
+def append_sample(path, result, run_date=None):
+    """
+    stores consensus prediction, view1 and the raw hits of all tools of one sample (SampleResult). results of a sample
+    that is already in the store are replaced
+    """
+    con = connect(path)
+    try:
+        with con:
+            old = con.execute("SELECT sample_id FROM samples WHERE sample = ?", (result.sample,)).fetchone()
+            if old:
+                for table in ["consensus", "view1", "hits", "samples"]:
+                    con.execute(f"DELETE FROM {table} WHERE sample_id = ?", old)
+            sample_id = con.execute("INSERT INTO samples (sample, species, label, run_date, created) VALUES (?, ?, ?, ?, ?)",
+                                    (result.sample, result.species, result.label, run_date or time.strftime("%Y-%m-%d"), time.time())).lastrowid
+            con.executemany("INSERT INTO consensus VALUES (?, ?, ?, ?)",
+                            [(sample_id, str(drug), none_if_nan(float(row["Mean weighted score"])), int(bool(row["Above resistance cutoff"])))
+                             for drug, row in result.consensus.iterrows()])
+            con.executemany("INSERT INTO view1 VALUES (?, ?, ?, ?, ?)", view1_rows(sample_id, result.view1))
+            con.executemany("INSERT INTO hits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", hit_rows(sample_id, result.dfs, result.methods))
+    finally:
+        con.close()
+
+
+def query_table(path, table, species=None, drugs=None, since=None, until=None):
+    """
+    rows of consensus, view1 or hits joined with sample, species and run_date. the filters are applied by sqlite
+    """
+    if table not in ["consensus", "view1", "hits"]:
+        raise ValueError(f"unknown table: {table}")
+    drug_column = {"consensus": "consensus.drug", "view1": "view1.drug"}.get(table)
+    where, params = sample_filter(species, drugs, since, until, drug_column)
+    con = connect(path)
+    try:
+        return pd.read_sql_query(f"SELECT samples.sample, samples.species, samples.run_date, {table}.* FROM {table} "
+                                 f"JOIN samples ON samples.sample_id = {table}.sample_id{where} ORDER BY {table}.sample_id, {table}.rowid",
+                                 con, params=params)
+    finally:
+        con.close()
+
+
+def combined_tables(path, species=None, drugs=None, since=None, until=None):
+    """
+    the tables of combine_reports.py from the store: "consensus_prediction" (drugs x samples, resistance above cutoff)
+    and one table per tool (True if the tool found a gene for the drug)
+    return: dict name -> pd.DataFrame
+    """
+    tables = {}
+    consensus = query_table(path, "consensus", species, drugs, since, until)
+    if not consensus.empty:
+        consensus["resistant"] = consensus["resistant"].astype(bool)
+        tables["consensus_prediction"] = sample_matrix(consensus, "resistant")
+
+    view1 = query_table(path, "view1", species, drugs, since, until)
+    for tool in pd.unique(view1["tool"]):
+        df = view1[view1["tool"] == tool].assign(found=True)
+        tables[tool] = sample_matrix(df, "found").reindex(index=pd.unique(view1["drug"]), columns=pd.unique(view1["sample"]))
+    return tables
+
+
+def combined_view(path, species=None, drugs=None, since=None, until=None):
+    """
+    view1 of all samples below each other as in combine_view_with_style.py: one row per sample and tool, one column per drug
+    """
+    view1 = query_table(path, "view1", species, drugs, since, until)
+    if view1.empty:
+        return pd.DataFrame(columns=["Tool", "Sample_Name"])
+    view1 = view1.drop_duplicates(["sample_id", "tool", "drug"])
+    df = view1.set_index(["sample_id", "sample", "tool", "drug"])["genes"].unstack("drug")
+    rows = pd.MultiIndex.from_frame(view1[["sample_id", "sample", "tool"]].drop_duplicates())
+    df = df.reindex(index=rows, columns=pd.unique(view1["drug"]))
+    df = df.reset_index().drop("sample_id", axis=1).rename(columns={"sample": "Sample_Name", "tool": "Tool"}).rename_axis(columns=None)
+    return df[["Tool", "Sample_Name"] + [c for c in df.columns if c not in ["Tool", "Sample_Name"]]]
@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 
 import sys
+import os
 import csv
+import json
+import logging
 import pandas as pd
+import numpy as np
 import re
+from collections import Counter
+from pandas.api.extensions import take
+
+from abr_combine.genenames import gene_names
 
 #### tools cutoffs used for coloring ####
 
@@ -16,21 +24,78 @@ default_cutoffs = {
 
 colors = ["limegreen", "lightgreen", "lightgrey"]
 
+# rows per chunk when reading tool tables, bounds the memory used for large (metagenome) tables
+read_chunksize = 100000
+
+# read_table arguments of the tool tables
+table_formats = {"NCBIAMRFinder": {"ofs": "\t", "ifs": "/", "amr_col": "Subclass", "gene_col": "Gene symbol", "coverage": "% Coverage of reference sequence",
+                                   "identity": "% Identity to reference sequence", "report": ["Method"]},
+                 "CARD-RGI": {"ofs": "\t", "ifs": "; ", "amr_col": "Drug Class", "gene_col": "Best_Hit_ARO", "sel_col": "Cut_Off", "sel_val": "Loose",
+                              "quality": "Cut_Off"},
+                 "ResFinder": {"ofs": "\t", "ifs": ",", "amr_col": "Phenotype", "gene_col": "Resistance gene", "coverage": "Coverage", "identity": "Identity"},
+                 }
+
+# PointFinder outputs of a ResFinder run in order of preference: gene block table, tab-separated results, json (ResFinder 4.1)
+pointfinder_files = ["PointFinder_table.txt", "PointFinder_results.txt", "std_format_under_development.json"]
+
+regex_prot_mutation = re.compile(r"([a-zA-Z0-9 ]*) p\.([A-Z])([0-9]*)([A-Z]).*")
+regex_nucl_mutation = re.compile(r"([a-zA-Z0-9 ]*) [nr]\.(-*[0-9]*)([ACGT])>([ACGT]).*")
+
+logger = logging.getLogger(__name__)
+
 
 #### internal functions ####
 
-def read_amr(tool_output, tool):
-    if tool == "NCBIAMRFinder":
-        return read_table(tool_output, tool, ofs="\t", ifs="/", amr_col="Subclass", gene_col="Gene symbol",
-                          coverage="% Coverage of reference sequence", identity="% Identity to reference sequence", report=["Method"])
-    elif tool == "CARD-RGI":
-        return read_table(tool_output, tool, ofs="\t", ifs="; ", amr_col="Drug Class", gene_col="Best_Hit_ARO",
-                          sel_col="Cut_Off", sel_val="Loose", quality="Cut_Off")
-    elif tool == "ResFinder":
-        df = read_table(f"{tool_output}/ResFinder_results_tab.txt", tool, ofs="\t", ifs=",", amr_col="Phenotype", gene_col="Resistance gene",
-                          coverage="Coverage", identity="Identity")
-        df = pd.concat([df, read_pointfinder(f"{tool_output}/PointFinder_table.txt", "ResFinder")], ignore_index=True)
-        return df
+def read_amr(tool_output, tool, hits=None):
+    """
+    hits: dict that gets the hits of the tool before one hit per gene is selected ({"table": ..., "point": PointFinder
+    mutations or None}), to select them again with other cutoffs (see reselect_hits)
+    """
+    tool_hits = {"point": None}
+    if tool == "ResFinder":
+        df = read_table(f"{tool_output}/ResFinder_results_tab.txt", tool, hits=tool_hits, **table_formats[tool])
+        tool_hits["point"] = read_pointfinder(pointfinder_output(tool_output), "ResFinder")
+        df = pd.concat([df, tool_hits["point"]], ignore_index=True)
+    else:
+        df = read_table(tool_output, tool, hits=tool_hits, **table_formats[tool])
+    if hits is not None:
+        hits[tool] = tool_hits
+    return df
+
+
+def reselect_hits(tool_hits, tool, cutoffs=default_cutoffs):
+    """
+    table of read_amr from the hits it stored, one hit per gene is selected with cutoffs
+    """
+    fmt = table_formats[tool]
+    df = select_hits(tool_hits["table"].copy(), tool, cutoffs=cutoffs, **{k: fmt.get(k) for k in ["ifs", "amr_col", "gene_col", "report", "coverage", "identity", "quality"]})
+    if tool_hits["point"] is not None:
+        df = pd.concat([df, tool_hits["point"]], ignore_index=True)
+    return df
+
+
+def normalise_gene_names(s):
+    """
+    maps gene names of a pd.Series to the merge key "mo" using the shared gene name cache,
+    every distinct name is looked up once
+    """
+    codes, uniques = pd.factorize(s)
+    mo = np.array([gene_names.normalise(name) for name in uniques] + [np.nan], dtype=object)
+    return pd.Series(mo[codes], index=s.index)
+
+
+def select_colors(df, tool, cutoffs=default_cutoffs, colors=colors):
+    """
+    vectorized select_color, returns the color index for all rows of df
+    """
+    cutoffs = cutoffs[tool]
+    keys = list(cutoffs.keys())
+    tiers = list(range(len(cutoffs[keys[0]])))
+    if len(cutoffs) > 1:
+        conditions = [np.logical_and.reduce([df[k].to_numpy() >= cutoffs[k][i] for k in keys]) for i in tiers]
+    else:
+        conditions = [df[keys[0]].to_numpy() == val for val in cutoffs[keys[0]]]
+    return np.select(conditions, tiers, default=tiers[-1])
 
 
 def select_color(row, tool, cutoffs=default_cutoffs, colors=colors):
@@ -49,68 +114,180 @@ def select_color(row, tool, cutoffs=default_cutoffs, colors=colors):
         return i
 
 
-def read_pointfinder(textfile, tool = "ResFinder"):
-    regex_nucl_mutation =  re.compile(r"([a-zA-Z0-9 ]*) [nr]\.(-*[0-9]*)([ACGT])>([ACGT]).*")
-    regex_prot_mutation =  re.compile(r"([a-zA-Z0-9 ]*) p\.([A-Z])([0-9]*)([A-Z]).*")
-    target_genes = []
-    store = []
+def read_columns(textfile, sep, columns, categories=[], sel_col=None, sel_val=None):
+    """
+    reads only the given columns of a table in chunks of read_chunksize rows and drops rows with sel_col == sel_val
+    while reading. categories: repetitive text columns that are kept as categorical while reading
+    """
+    columns = set(columns)
+    chunks = []
+    with pd.read_csv(textfile, sep=sep, usecols=lambda c: c in columns, dtype={c: "category" for c in categories},
+                     chunksize=read_chunksize) as reader:
+        for chunk in reader:
+            if sel_col:
+                chunk = chunk[chunk[sel_col] != sel_val]
+            chunks.append(chunk)
+    df = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    # the filtered table is small, plain strings keep sorting and string operations as for an unfiltered read
+    return df.astype({c: object for c in df.columns if df[c].dtype.name == "category"})
+
+
+def pointfinder_output(tool_output):
+    for name in pointfinder_files:
+        path = os.path.join(tool_output, name)
+        if os.path.exists(path):
+            return path
+    return os.path.join(tool_output, pointfinder_files[0])
+
+
+def gene_prefixes(genes):
+    """
+    prefix index of the target genes: gene -> position in genes and the distinct gene name lengths
+    """
+    index = {}
+    for i, gene in enumerate(genes):
+        index.setdefault(gene, i)
+    return index, sorted(set(len(gene) for gene in index))
+
+
+def line_gene(line, index, lengths):
+    """
+    first target gene (in order of the Genes: line) that line starts with, None if there is none
+    """
+    matches = [(index[line[:n]], line[:n]) for n in lengths if line[:n] in index]
+    return min(matches)[1] if matches else None
+
+
+def parse_pointfinder_table(inf_h):
+    """
+    PointFinder_table.txt: a block of known mutations per target gene
+    return: list of (resistance, mutation, gene block), resistance is None for other lines of a block (i.e. No mutations found)
+    """
+    records = []
+    index, lengths = gene_prefixes([])
     res_column = 0
-    header = False
     gene_block = None
-    with open(textfile, "r") as inf_h:
-        for line in inf_h:
-            if line.startswith("Genes:"):
-                target_genes = [t.strip() for t in line[6:].split(",")]
-                print(target_genes)
-                continue
-            if not line.strip():
-                gene_block = None
-                continue
-            if gene_block:
-                if line.startswith("Mutation"):
-                    for i, colname in enumerate(line.split("\t")):
-                        if colname.strip() == "Resistance":
-                            res_column = i
-                    continue
-                elif line.startswith(gene_block):
-                    fields = line.strip().split("\t")
-                    print(fields)
-                    mutation = fields[0]
-                    m = regex_prot_mutation.search(mutation)
-                    if m:
-                        mut_name = m.group(1) + "_" + m.group(2) + str(m.group(3)) + m.group(4)
-                    else:
-                        m = regex_nucl_mutation.search(mutation)
-                        if m:
-                            mut_name = m.group(1) + "_" + m.group(3) + str(m.group(2)) + m.group(4)
-                        else:
-                            mut_name = mutation
-                    
-                    for r in fields[res_column].split(","):
-                        store.append([r.strip().lower(), mutation, mut_name.lower(), 0])
-                else:
-                    store.append(["info", gene_block + ": " + line.strip(), gene_block, 2])
+    for line in inf_h:
+        if line.startswith("Genes:"):
+            target_genes = [t.strip() for t in line[6:].split(",")]
+            logger.debug("PointFinder target genes: %s", target_genes)
+            index, lengths = gene_prefixes(target_genes)
+            continue
+        if not line.strip():
+            gene_block = None
+            continue
+        if gene_block:
+            if line.startswith("Mutation"):
+                for i, colname in enumerate(line.split("\t")):
+                    if colname.strip() == "Resistance":
+                        res_column = i
+            elif line.startswith(gene_block):
+                fields = line.strip().split("\t")
+                records.append((fields[res_column], fields[0], gene_block))
             else:
-                for gene in target_genes:
-                    if line.startswith(gene.strip()):
-                        gene_block = gene.strip()
-                        print(gene_block)
-                        header = True
-                        break
-                                                                                                                            
-    
+                records.append((None, line.strip(), gene_block))
+        else:
+            gene_block = line_gene(line, index, lengths)
+    return records
+
+
+def parse_pointfinder_results(inf_h):
+    """
+    PointFinder_results.txt: one line per mutation below a header line
+    """
+    records = []
+    res_column = 0
+    for line in inf_h:
+        if line.startswith("Mutation"):
+            for i, colname in enumerate(line.split("\t")):
+                if colname.strip() == "Resistance":
+                    res_column = i
+        elif line.strip():
+            fields = line.strip().split("\t")
+            records.append((fields[res_column], fields[0], None))
+    return records
+
+
+def parse_pointfinder_json(inf_h):
+    """
+    seq_variations of the ResFinder json output, phenotype keys are antibiotic names
+    """
+    data = json.load(inf_h)
+    regions = data.get("seq_regions", {})
+    records = []
+    for variation in data.get("seq_variations", {}).values():
+        keys = variation.get("seq_regions") or [variation.get("key", "")]
+        gene = regions.get(keys[0], {}).get("name") or keys[0].split(";;")[0]
+        resistance = ",".join(p.replace("_", " ") for p in variation.get("phenotypes", [])) or "Unknown"
+        records.append((resistance, f"{gene} {variation.get('seq_var', '')}", None))
+    return records
+
+
+def mutation_name(mutation):
+    """
+    merge key of a mutation, i.e. "gyrA p.S83L" -> "gyra_s83l", "ampC n.-42C>T" -> "ampc_c-42t"
+    """
+    m = regex_prot_mutation.search(mutation)
+    if m:
+        return "{0}_{1}{2}{3}".format(*m.groups()).lower()
+    m = regex_nucl_mutation.search(mutation)
+    if m:
+        return "{0}_{2}{1}{3}".format(*m.groups()).lower()
+    return mutation.lower()
+
+
+def read_pointfinder(textfile, tool = "ResFinder"):
+    """
+    reads PointFinder mutations from PointFinder_table.txt, PointFinder_results.txt or the ResFinder json output
+    """
+    with open(textfile, "r") as inf_h:
+        if textfile.endswith(".json"):
+            records = parse_pointfinder_json(inf_h)
+        elif inf_h.readline().startswith("Mutation"):
+            inf_h.seek(0)
+            records = parse_pointfinder_results(inf_h)
+        else:
+            inf_h.seek(0)
+            records = parse_pointfinder_table(inf_h)
+
+    # resistance lists repeat within a report, each distinct mutation and resistance list is parsed once
+    names = {}
+    antibiotics = {}
+    store = []
+    for resistance, mutation, gene in records:
+        if resistance is None:
+            store.append(["info", gene + ": " + mutation, gene, 2])
+            continue
+        if mutation not in names:
+            names[mutation] = mutation_name(mutation)
+        if resistance not in antibiotics:
+            antibiotics[resistance] = [r.strip().lower() for r in resistance.split(",")]
+        mut_name = names[mutation]
+        store.extend([r, mutation, mut_name, 0] for r in antibiotics[resistance])
+    n_info = sum(resistance is None for resistance, mutation, gene in records)
+    logger.debug("%s: %d mutations, %d other lines", textfile, len(records) - n_info, n_info)
+
     df = pd.DataFrame(store, columns=[f"antibiotic_{tool}",tool,"mo",f"color_{tool}"])
     df.drop_duplicates(subset=["mo"], inplace=True)
     return df
 
 
-def read_table(textfile, tool, ofs, ifs, amr_col, gene_col, sel_col=None, sel_val=None, report=None, coverage=None, identity=None, quality=None):
-    df = pd.read_csv(textfile, sep=ofs)
+def read_table(textfile, tool, ofs, ifs, amr_col, gene_col, sel_col=None, sel_val=None, report=None, coverage=None, identity=None, quality=None, hits=None):
+    """
+    hits: dict that gets the hits as read ("table") before select_hits
+    """
+    # read only the used columns and filter out low quality hits while reading, if applicable
+    df = read_columns(textfile, ofs, [c for c in [amr_col, gene_col, sel_col, coverage, identity, quality] + (report or []) if c],
+                      [c for c in [amr_col, sel_col, quality] + (report or []) if c], sel_col, sel_val)
+    if hits is not None:
+        hits["table"] = df.copy()
+    return select_hits(df, tool, ifs, amr_col, gene_col, report, coverage, identity, quality)
 
-    # filter out low quality hits if applicable
-    if sel_col:
-        df = df[df[sel_col] != sel_val]
 
+def select_hits(df, tool, ifs, amr_col, gene_col, report=None, coverage=None, identity=None, quality=None, cutoffs=default_cutoffs):
+    """
+    colors the hits with cutoffs and keeps the best hit per gene and merge key
+    """
     ab_colname=f"antibiotic_{tool}"
     color_colname=f"color_{tool}"
     specified = None
@@ -127,7 +304,7 @@ def read_table(textfile, tool, ofs, ifs, amr_col, gene_col, sel_col=None, sel_va
         if df.empty:
             df = pd.DataFrame(columns=list(df.columns) + [color_colname])
         else:
-            df[color_colname] = df.apply(select_color, axis=1, args=[tool])
+            df[color_colname] = select_colors(df, tool, cutoffs)
             df = df.sort_values(by=color_colname, ascending=True)
 
     if not df.empty:
@@ -141,27 +318,7 @@ def read_table(textfile, tool, ofs, ifs, amr_col, gene_col, sel_col=None, sel_va
             df[gene_col] = df[gene_col].str.split("_",expand=True)[0]
 
         df[tool] = df[gene_col]
-        # extract gene names from CARD-RGI: often text with starting with: "Species name genename ... "
-        df["mo"] = df[gene_col].str.extract("^[A-Z][a-z-]* [a-z]* ([A-Za-z0-9-]*)")
-
-        # extract gene names from CARD-RGI: often text with starting with: "Long description \(genename\) ... "
-        df["moX"] = df[gene_col].str.extract("^.* \(([A-Za-z0-9-]*)\)")
-        df["mo"] = df["mo"].combine_first(df["moX"])
-
-        # remove "bla" prefix from ResFinder and AMRFinderPlus to merge with CARD-RGI bla-genes
-        df["mo2"] = df[gene_col].str.replace("bla","")
-
-        # remove "delta" suffix from AMRFinderPlus and CARD-RGI
-        df["mo2"] = df["mo2"].str.replace("delta[0-9]*$", "", regex=True)
-
-        # combine the extracted names with the trimmed names
-        df["mo"] = df["mo"].combine_first(df["mo2"])
-
-        # remove "-number" suffix when multiple alleles of a gene are identifyable
-        df["mo"] = df["mo"].str.replace("-*[0-9]*$","", regex=True)
-
-        # set all to lowercase (merging is case sensitive)
-        df["mo"] = df["mo"].str.lower()
+        df["mo"] = normalise_gene_names(df[gene_col])
 
         # filter low scoring hits if high scores are available too
         #maximum = df.groupby("mo")[color_colname].max()
@@ -174,7 +331,7 @@ def read_table(textfile, tool, ofs, ifs, amr_col, gene_col, sel_col=None, sel_va
             df.drop_duplicates("mo", inplace=True)
     
     report_cols = [ab_colname,tool,"mo"]
-    print(report_cols)
+    logger.debug("%s columns: %s", tool, report_cols)
     if specified:
         report_cols.extend(specified)
     if color_colname in df.columns:
@@ -187,9 +344,33 @@ def read_table(textfile, tool, ofs, ifs, amr_col, gene_col, sel_col=None, sel_va
         return df[report_cols]
 
 
+def suffix_collisions(dfs, on=None):
+    """
+    appends _i (position of the frame in dfs) to every column that is not the merge key and occurs in more than one frame
+    """
+    counts = Counter(c for df in dfs for c in df.columns if c != on)
+    renamed = []
+    for i, df in enumerate(dfs):
+        names = {c: f"{c}_{i}" for c in df.columns if c != on and counts[c] > 1}
+        renamed.append(df.rename(columns=names) if names else df)
+    return renamed
+
+
+def merge_pairwise(dfs, on=None):
+    df = dfs[0]
+    for other in dfs[1:]:
+        if not on:
+            df = pd.merge(df, other, left_index=True, right_index=True, how="outer")
+        else:
+            df = pd.merge(df, other, on=on, how="outer")
+    return df
+
+
 def combine_tables(dfs, on=None):
     """
-    Subroutine to merge multiple pandas dataframes to one, merging on "mo" (stands for merge-on!)
+    Subroutine to merge multiple pandas dataframes to one, merging on "mo" (stands for merge-on!) or the index if on is None.
+    all frames are aligned in one step with the rows in the order of pairwise outer merges, frames with duplicate or missing
+    keys are merged pairwise. columns that occur in several frames get the suffix _i of their frame
     """
 
     if all([df.empty for df in dfs]):
@@ -200,18 +381,39 @@ def combine_tables(dfs, on=None):
         return pd.DataFrame(columns=columns)
 
     if len(dfs) < 2:
-        df = dfs[0]
-    else:
-        for i in range(len(dfs) - 1):
-            suffixes = ["_"+str(i*2),"_"+str(i*2 + 1)]
-            if i == 0:
-                df = dfs[0]
-            if not on:
-                df = pd.merge(df, dfs[i+1], left_index=True, right_index=True, how="outer", suffixes=suffixes)
-            else:
-                df = pd.merge(df, dfs[i+1], on=on, how="outer", suffixes=suffixes)
-
-    return df
+        return dfs[0]
+
+    dfs = suffix_collisions([df.to_frame() if isinstance(df, pd.Series) else df for df in dfs], on)
+    if not on:
+        if not all(df.index.is_unique and not df.index.hasnans for df in dfs):
+            return merge_pairwise(dfs)
+        # rows in the order of successive outer joins, only the indexes are joined pairwise
+        index = dfs[0].index
+        for df in dfs[1:]:
+            index = index.join(df.index, how="outer")
+        return pd.concat(dfs, axis=1, sort=False).reindex(index)
+
+    # hash join: position of the keys of each frame in the union of all keys (in order of appearance)
+    keys = [df[on].to_numpy() for df in dfs]
+    union = pd.Index(pd.unique(np.concatenate(keys)))
+    positions = [union.get_indexer(k) for k in keys]
+    if union.hasnans or any(len(k) and np.bincount(pos).max() > 1 for k, pos in zip(keys, positions)):
+        return merge_pairwise(dfs, on)
+
+    # the key keeps its position in the first frame with rows, as with pairwise merges
+    first = next(i for i, df in enumerate(dfs) if not df.empty)
+    columns = {}
+    for i, (df, pos) in enumerate(zip(dfs, positions)):
+        # row of the frame for every key of the union, -1 if missing
+        rows = np.full(len(union), -1, dtype=np.intp)
+        rows[pos] = np.arange(len(df))
+        for c in df.columns:
+            if c != on:
+                values = df[c].array if pd.api.types.is_extension_array_dtype(df[c].dtype) else df[c].to_numpy()
+                columns[c] = take(values, rows, allow_fill=True)
+            elif i == first:
+                columns[c] = union.to_numpy()
+    return pd.DataFrame(columns)
 
 
 def write_table(df, outputfile):
@@ -224,18 +426,15 @@ def write_table(df, outputfile):
 
 def color_table(df):
     """
-    colors cells using the defined list: colors
+    colors cells using the defined list: colors. returns a Styler of df without the color columns, df is not changed
     """
-    df_color = df.copy() #[[c for c in df.columns if c.startswith("color_")]]
-    for c in df_color.columns:
-        if c.startswith("color_"):
-            if not df.empty:
-                df_color[c.split("_")[1]] = df_color[c].apply(lambda k: f"background-color: {colors[int(k)]}" if k >= 0 else "")
-            df_color.drop(c, axis=1, inplace=True)
-            df.drop(c, axis=1, inplace=True)
-        else:
-            df_color[c] = ""
+    df_color = pd.DataFrame("", index=df.index, columns=[c for c in df.columns if not c.startswith("color_")])
+    if not df.empty:
+        for c in df.columns:
+            if c.startswith("color_"):
+                df_color[c.split("_")[1]] = df[c].apply(lambda k: f"background-color: {colors[int(k)]}" if k >= 0 else "")
 
+    df = df[[c for c in df.columns if not c.startswith("color_")]]
     df = df.style.apply(lambda k: df_color, axis=None)
     return df
 
@@ -244,23 +443,120 @@ def view_by_genes(df_in, methods):
     """
     Function to create output table that just aligns all genes and lists potential ABR that are mapped to this gene
     """
-    df = df_in.copy()
-    view_cols = [c for c in df.columns if c.startswith("color") or c in methods] + ["Class", "predicted phenotype"]
-    if "antibiotic_phenotype" in df.columns:
-        df["predicted phenotype"] = df["antibiotic_phenotype"]
+    view_cols = [c for c in df_in.columns if c.startswith("color") or c in methods] + ["Class"]
+    if "antibiotic_phenotype" in df_in.columns:
+        phenotype = df_in["antibiotic_phenotype"]
     else:
-        df["predicted phenotype"] = ""
-    for c in df.columns:
+        phenotype = pd.Series("", index=df_in.index)
+    for c in df_in.columns:
         if c.startswith("antibiotic"):
-            df["predicted phenotype"] =  df["predicted phenotype"].combine_first(df[c])
+            phenotype = phenotype.combine_first(df_in[c])
 
-    return df[view_cols]
+    return pd.concat([df_in[view_cols], phenotype.rename("predicted phenotype")], axis=1)
 
 
-def view_by_antibiotic(df_in, methods):
+def view_by_antibiotic_dict(df_in, methods):
+    """
+    Engine of view_by_antibiotic that aggregates with plain dicts and creates the DataFrame only at the end.
+    returns None for input that only the pandas engine handles (tools without hits, non-text antibiotics, hits without color)
+    """
+    used = [m for m in methods if m != "phenotype" and m != "rgi_loose" and m in df_in.columns]
+    if df_in.empty or not used or any(f"color_{m}" not in df_in.columns for m in used):
+        return None
+
+    # antibiotics of each row: phenotype preferred, then the tools in column order
+    abcols = [c for c in df_in.columns if c.startswith("antibiotic")]
+    if "antibiotic_phenotype" in abcols:
+        abcols = ["antibiotic_phenotype"] + abcols
+        antibiotics = [None] * len(df_in)
+    else:
+        antibiotics = [""] * len(df_in)
+    for c in abcols:
+        antibiotics = [ab if ab is not None else (v if not pd.isna(v) else None) for ab, v in zip(antibiotics, df_in[c].tolist())]
+    if not any(isinstance(ab, str) for ab in antibiotics):
+        return None
+
+    # one entry per row and antibiotic (row=None for rows without antibiotic)
+    exploded = []
+    for row, ab in enumerate(antibiotics):
+        if ab is None:
+            exploded.append((None, row))
+        elif not isinstance(ab, str):
+            return None
+        else:
+            exploded.extend((a.strip(), row) for a in ab.split(","))
+
+    first_row = {}
+    for a, row in exploded:
+        first_row.setdefault(a, row)
+
+    tool_values = {}
+    color_values = {}
+    for m in used:
+        values = df_in[m].tolist()
+        color_col = df_in[f"color_{m}"]
+        color_list = color_col.tolist()
+        names = {}
+        colors_min = {}
+        for a, row in exploded:
+            if a is None:
+                continue
+            v = values[row]
+            if not pd.isna(v):
+                if not isinstance(v, str):
+                    return None
+                names.setdefault(a, {})[v] = True
+            c = color_list[row]
+            if not pd.isna(c):
+                colors_min[a] = min(colors_min[a], c) if a in colors_min else c
+
+        # an antibiotic is only reported for m if m has a hit in the row the antibiotic appears first
+        keys = [a for a in names if not pd.isna(values[first_row[a]])]
+        if not keys or any(a not in colors_min for a in keys):
+            return None
+        tool_values[m] = {a: ",".join(names[a]) for a in keys}
+        color_values[m] = {a: colors_min[a] for a in keys}
+
+    # row order as created by the pandas engine: each tool is sorted by antibiotic, joining tools with
+    # different antibiotics sorts by first appearance, antibiotics without tool result are appended
+    positions = {}
+    for pos, (a, row) in enumerate(exploded):
+        positions.setdefault(a, pos)
+    order = None
+    for m in used:
+        tool_order = sorted(tool_values[m])
+        if order is None:
+            order = tool_order
+        elif order != tool_order:
+            order = sorted(set(order) | set(tool_order), key=lambda a: positions[a])
+    ordered = set(order)
+    order.extend(a for a in positions if a not in ordered)
+
+    data = {}
+    for m in used:
+        data[m] = pd.Series([tool_values[m].get(a, np.nan) for a in order], dtype=object)
+    for m in used:
+        dtype = df_in[f"color_{m}"].dtype
+        if len(color_values[m]) < len(order) and dtype != object:
+            dtype = np.float64
+        data[f"color_{m}"] = pd.Series([color_values[m].get(a, np.nan) for a in order], dtype=dtype)
+
+    index = pd.Index([np.nan if a is None else a for a in order], dtype=object, name="antibiotic_final")
+    final_df = pd.DataFrame(data)
+    final_df.index = index
+    return final_df
+
+
+def view_by_antibiotic(df_in, methods, engine="dict"):
     """
-    Function to create a table that tries to get all antibiotic resistance names as columns
+    Function to create a table that tries to get all antibiotic resistance names as columns.
+    engine "dict" aggregates without pandas overhead, "pandas" uses DataFrame operations only
     """
+    if engine == "dict":
+        final_df = view_by_antibiotic_dict(df_in, methods)
+        if final_df is not None:
+            return final_df
+
     # columns which provide info on abr class
     df = df_in.copy()
     abcols = df.columns[[True if c.startswith("antibiotic") else False for c in df.columns]]
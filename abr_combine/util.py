@@ -3,7 +3,12 @@
 import sys
 import os
 import subprocess
-import re
+import time
+import glob
+import signal
+from collections import deque
+
+from abr_combine.registry import registry
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 EXT_DIR = os.path.join(ROOT_DIR, "..", "ext")
@@ -19,12 +24,36 @@ tools = {"name": ["CARD-RGI","NCBIAMRFinder","ResFinder"],
                            ],
         }
 
+# tools that make use of the --threads parameter
+multithreaded = ["CARD-RGI", "NCBIAMRFinder"]
+
+# seconds between checks of running tools
+poll_interval = 0.5
+
+# lines of the tool log written to STDERR when a tool fails, the log is removed with the temporary directory of the sample
+log_tail_lines = 50
+
+# result tables that can be merged from runs on shards of the input (ResFinder always runs on the complete input):
+# result table relative to the output prefix, contig column and the order of the hits in the table of a single run,
+# "input": contig order of the input fasta (genes predicted by prodigal), "name": sorted by contig name
+shard_tables = {"CARD-RGI": {"table": "{}.txt", "contig": "Contig", "order": "input"},
+                "NCBIAMRFinder": {"table": "{}", "contig": "Contig id", "order": "name"},
+                }
+
+# tools that run on shards with --shards. RGI is not sharded: prodigal is trained on each shard and can predict other genes
+# than on the complete input, add it once `python -m abr_combine.benchmark shards` shows identical tables with real RGI output
+shardable = ["NCBIAMRFinder"]
+
 
 #### internal functions #####
 
+def amrfinder_organisms(cmd):
+    availables_raw = registry.output(cmd, ["-l"], databases=database_paths("NCBIAMRFinder")).strip()
+    return [a.strip() for a in availables_raw.split(":")[1].split(",")]
+
+
 def transl_orgn_amrfinder(cmd, organism):
-    availables_raw = subprocess.check_output([cmd, "-l"]).decode().strip()
-    avail_list = [a.strip() for a in availables_raw.split(":")[1].split(",")]
+    avail_list = amrfinder_organisms(cmd)
     organism = "_".join(organism.split(" ")[:2])
     return find_orgn_in_list(avail_list, organism)
 
@@ -44,7 +73,8 @@ def find_orgn_in_list(orgn_list, orgn):
     return None
 
 
-def run_amrtool(tool, cmd, fasta_input, params, organism, tmpdir, threads):
+def amrtool_command(tool, cmd, fasta_input, params, organism, tmpdir, threads, prefix=None):
+    params = list(params)
     if tool == "NCBIAMRFinder":
         organism = transl_orgn_amrfinder(cmd, organism)
         params.extend(["-n", fasta_input])
@@ -60,19 +90,93 @@ def run_amrtool(tool, cmd, fasta_input, params, organism, tmpdir, threads):
     elif tool == "CARD-RGI":
         params.extend(["-i", fasta_input, "-n", str(threads)])
 
-    params.extend(["-o", f"{tmpdir}/{tool}"])
-    sys.stdout.write(f"Running {tool}:\n%s" % " ".join([cmd, *params]))
-    try:
-        subprocess.check_call([cmd, *params])
-        return 0
-    except subprocess.CalledProcessError:
-        return 1
+    params.extend(["-o", prefix or f"{tmpdir}/{tool}"])
+    return [cmd, *params]
+
+
+def write_log_tail(job, log, lines=log_tail_lines):
+    """
+    writes the last lines of the stdout and stderr of a tool to STDERR
+    """
+    with open(log, "rb") as inf_h:
+        tail = [line.decode(errors="replace").rstrip("\r\n") for line in deque(inf_h, lines)]
+    sys.stderr.write(f"Last {len(tail)} lines of the output of {job}:\n")
+    sys.stderr.writelines(f"  {line}\n" for line in tail)
+
+
+def merge_shard_tables(tables, outfile, contig_col, order, contigs):
+    """
+    concatenates the result tables of the shard runs of a tool with one header. hits are sorted as in the table of a run
+    on the complete input, so duplicate hits on different shards are resolved by read_amr as without sharding
+    """
+    header = None
+    rows = []
+    for table in tables:
+        with open(table, "r") as inf_h:
+            lines = inf_h.readlines()
+        if lines:
+            header = header or lines[0]
+            rows.extend(line if line.endswith("\n") else line + "\n" for line in lines[1:] if line.strip())
+
+    if header and rows:
+        col = header.rstrip("\n").split("\t").index(contig_col)
+        if order == "name":
+            rows.sort(key=lambda row: row.split("\t")[col])
+        else:
+            # contig of RGI hits is <contig>_<orf number>
+            position = {contig: i for i, contig in enumerate(contigs)}
+            def contig_position(row):
+                contig = row.split("\t")[col]
+                return position.get(contig, position.get(contig.rsplit("_", 1)[0], len(position)))
+            rows.sort(key=contig_position)
+
+    with open(outfile, "w") as outf_h:
+        outf_h.write(header or "")
+        outf_h.writelines(rows)
 
 
+def split_threads(selected, threads):
+    """
+    distributes the thread budget over the selected tools. single-threaded tools get one thread,
+    the remaining threads are shared by the multithreaded tools
+    """
+    shares = {tool: 1 for tool in selected}
+    multi = [tool for tool in selected if tool in multithreaded]
+    free = threads - len(selected) + len(multi)
+    for i, tool in enumerate(multi):
+        shares[tool] = max(1, free // len(multi) + (1 if i < free % len(multi) else 0))
+    return shares
+
 
 #### functions that might be called from outside ####
 
 
+def database_paths(tool):
+    """
+    files and directories of the database of tool, their fingerprint (abr_combine.registry.fingerprint) changes with
+    database updates that keep the executable. AMRFinder and RGI databases are looked up next to the installation
+    """
+    if tool == "ResFinder":
+        paths = []
+        for db in ["db_resfinder", "db_pointfinder"]:
+            for root, dirs, files in os.walk(os.path.join(EXT_DIR, db)):
+                dirs[:] = sorted(d for d in dirs if d != ".git")
+                paths.extend(os.path.join(root, f) for f in sorted(files))
+        return paths
+    try:
+        exe = os.path.realpath(registry.resolve(tools["cmd"][tools["name"].index(tool)]))
+    except (ValueError, FileNotFoundError):
+        return []
+    prefix = os.path.dirname(os.path.dirname(exe))
+    if tool == "NCBIAMRFinder":
+        # "latest" links to the directory of the current database version
+        latest = [os.path.join(os.path.dirname(exe), "data", "latest"), os.path.join(prefix, "share", "amrfinderplus", "data", "latest")]
+        return latest + [os.path.realpath(path) for path in latest]
+    if tool == "CARD-RGI":
+        return sorted(glob.glob(os.path.join(prefix, "lib", "python*", "site-packages", "app", "_data", "*.json")))
+    return []
+
+
 def find_tools(selected):
     nd_tools = []
     for tool, cmd, params in zip(tools["name"], tools["cmd"], tools["test"]):
@@ -81,20 +185,105 @@ def find_tools(selected):
         try:
             #sys.stdout.write(f"{tool} version:")
             #sys.stdout.write(" ".join([cmd, *params]))
-            stdout = subprocess.check_output([cmd, *params], stderr=subprocess.STDOUT)
+            stdout = registry.output(cmd, params, stderr=True)
         except FileNotFoundError:
             nd_tools.append(tool)
             sys.stdout.write("Tool not found: %s" % tool)
     return nd_tools
 
 
-def run_tools(selected, inputfile, organism, tmpdir, threads):
+def wait_tool(proc, block=False):
+    """
+    reaps the tool process with os.wait4 to obtain its resource usage
+    return: rusage or None if the process is still running
+    """
+    pid, status, rusage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+    if pid == 0:
+        return None
+    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return rusage
+
+
+def run_tools(selected, inputfile, organism, tmpdir, threads, timeout=None, metrics=None, shards=None, contigs=None, sharded=shardable):
+    """
+    starts all selected tools as parallel subprocesses and waits for them to finish.
+    tools that fail or exceed timeout are removed from selected. timeout: seconds each tool (each shard run) may take from its own start,
+    the tools start together, so a sample takes at most about timeout seconds. timed out tools are killed with all their child processes
+    wall time and resource usage of the tools are recorded in metrics (abr_combine.metrics.Metrics)
+    shards: fasta files with parts of inputfile (see abr_combine.fasta.shard_fasta), the tools in sharded (default: shardable) run on each
+    shard in parallel and their tables are merged (contigs: contig names in input order)
+    """
+    shares = split_threads(selected, threads)
+    jobs = []
     for tool, cmd, params in zip(tools["name"], tools["cmd"], tools["default_params"]):
-        if tool in selected:
-            exit_code = run_amrtool(tool, cmd, inputfile, params, organism, tmpdir, threads)
-            if exit_code != 0:
-                sys.stdout.write("Execution of tool failed: %s" % tool)
-                selected.remove(tool) 
+        if tool not in selected:
+            continue
+        if shards and len(shards) > 1 and tool in sharded:
+            os.makedirs(f"{tmpdir}/shards", exist_ok=True)
+            for i, shard in enumerate(shards):
+                prefix = f"{tmpdir}/shards/{tool}.{i}"
+                shard_threads = max(1, shares[tool] // len(shards))
+                jobs.append((tool, f"{tool}.shard{i}", f"{prefix}.log", shard_threads,
+                             amrtool_command(tool, cmd, shard, params, organism, tmpdir, shard_threads, prefix)))
+        else:
+            jobs.append((tool, tool, f"{tmpdir}/{tool}.log", shares[tool], amrtool_command(tool, cmd, inputfile, params, organism, tmpdir, shares[tool])))
 
+    running = {}
+    failed = set()
+    for tool, job, log, job_threads, command in jobs:
+        if tool in failed:
+            continue
+        sys.stdout.write(f"Running {job} ({job_threads} threads):\n%s\n" % " ".join(command))
+        log_h = open(log, "wb")
+        try:
+            # own process group, so wrapper scripts are killed on timeout together with the processes they started
+            proc = subprocess.Popen(command, stdout=log_h, stderr=subprocess.STDOUT, start_new_session=True)
+        except OSError:
+            log_h.close()
+            sys.stdout.write("Execution of tool failed: %s\n" % tool)
+            failed.add(tool)
+            continue
+        running[job] = (tool, proc, log_h, log, time.time())
+
+    while running:
+        for job in list(running.keys()):
+            tool, proc, log_h, log, start = running[job]
+            rusage = wait_tool(proc)
+            if rusage is None:
+                if timeout is None or time.time() - start < timeout:
+                    continue
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                rusage = wait_tool(proc, block=True)
+                sys.stdout.write(f"{job} exceeded timeout of {timeout} seconds\n")
+            log_h.close()
+            del running[job]
+            if metrics is not None:
+                metrics.add_tool(job, time.time() - start, rusage, proc.returncode)
+            if proc.returncode != 0:
+                sys.stdout.write(f"Execution of tool failed: {job} (exit code {proc.returncode})\n")
+                write_log_tail(job, log)
+                failed.add(tool)
+        if running:
+            time.sleep(poll_interval)
+
+    for tool in failed:
+        selected.remove(tool)
+    for tool in selected:
+        if shards and len(shards) > 1 and tool in sharded:
+            table = shard_tables[tool]["table"]
+            merge_shard_tables([table.format(f"{tmpdir}/shards/{tool}.{i}") for i in range(len(shards))], table.format(f"{tmpdir}/{tool}"),
+                               shard_tables[tool]["contig"], shard_tables[tool]["order"], contigs or [])
     return selected
 
+
+def prepare_tools(selected):
+    """
+    probes everything the tool commands depend on (amrfinder organism list) once, so it can be reused
+    from the registry by all samples
+    """
+    for tool, cmd in zip(tools["name"], tools["cmd"]):
+        if tool == "NCBIAMRFinder" and tool in selected:
+            amrfinder_organisms(cmd)
@@ -1,17 +1,16 @@
 import os
 import re
-import subprocess
-import pandas as pd
+import csv
 
-from git import Repo
-from abr_combine.util import tools, ROOT_DIR, EXT_DIR
+from abr_combine.util import tools, ROOT_DIR, EXT_DIR, database_paths
+from abr_combine.registry import registry
 
 version="0.1a"
 
 def get_version_ncbi(cmd):
-    stdout = subprocess.check_output([cmd,"-l"], stderr=subprocess.STDOUT)
+    stdout = registry.output(cmd, ["-l"], stderr=True, databases=database_paths("NCBIAMRFinder"))
     version_tool, version_db = ["", ""]
-    for line in stdout.decode().split("\n"):
+    for line in stdout.split("\n"):
         m = re.search("Software version: (\S+)", line)
         if m:
             version_tool = m.group(1)
@@ -22,14 +21,14 @@ def get_version_ncbi(cmd):
 
  
 def get_version_card(cmd):
-    stdout = subprocess.check_output([cmd,"main","-v"], stderr=subprocess.STDOUT)
-    version_tool = stdout.decode().strip()
-    stdout = subprocess.check_output([cmd,"database","-v"], stderr=subprocess.STDOUT)
-    version_db = stdout.decode().strip()
+    version_tool = registry.output(cmd, ["main","-v"], stderr=True).strip()
+    version_db = registry.output(cmd, ["database","-v"], stderr=True, databases=database_paths("CARD-RGI")).strip()
     return f"rgi-{version_tool};db-{version_db}"
 
 
 def get_git_version(gitdir):
+    # GitPython is only loaded if the versions are collected, not if they are read from versions.csv
+    from git import Repo
     try:
         repo = Repo(gitdir)
     except:
@@ -45,25 +44,28 @@ def get_git_version(gitdir):
 
 
 def get_version_resfinder(cmd):
-    version_tool, commit = get_git_version(os.path.join(EXT_DIR,"resfinder"))
-    version_acq, commit = get_git_version(os.path.join(EXT_DIR,"db_resfinder"))
-    version_point, commit = get_git_version(os.path.join(EXT_DIR,"db_pointfinder"))
+    version_tool, commit = registry.git_version(os.path.join(EXT_DIR,"resfinder"), get_git_version)
+    version_acq, commit = registry.git_version(os.path.join(EXT_DIR,"db_resfinder"), get_git_version)
+    version_point, commit = registry.git_version(os.path.join(EXT_DIR,"db_pointfinder"), get_git_version)
     return f"resfinder-{version_tool};acqdb-{version_acq};pointdb-{version_point}"
 
 
 def get_version_main():
-    v, commit = get_git_version(os.path.dirname(ROOT_DIR))
+    v, commit = registry.git_version(os.path.dirname(ROOT_DIR), get_git_version)
     return f"{v}-{commit}"
 
-def get_version(force=False):
+def get_versions(force=False):
     """
     collects information of all versions. this is required to be run on setup
     resfinder is using git repositories to obtain version, which is not preserved otherwise.
-    return: version: pd.Dataframe
+    return: list of [toolname, version]
     """
     versionsfile = ROOT_DIR + "/versions.csv"
+    if force:
+        registry.clear()
     if os.path.exists(versionsfile) and not force:
-        version_df = pd.read_csv(versionsfile, sep="\t", header=None, names=["toolname","version"])
+        with open(versionsfile, "r", newline="") as inf_h:
+            versions = [row for row in csv.reader(inf_h, delimiter="\t") if row]
     else:
         versions = []
         for i, tool in enumerate(tools["name"] + ["Main"]):
@@ -79,7 +81,19 @@ def get_version(force=False):
                 continue
             versions.append([tool, version_string])
 
-        version_df = pd.DataFrame(versions, columns=["toolname","version"])
-        version_df.to_csv(versionsfile, sep="\t", index=False)
+        with open(versionsfile, "w", newline="") as outf_h:
+            csv.writer(outf_h, delimiter="\t", lineterminator="\n").writerows([["toolname", "version"]] + versions)
+
+    return versions
+
+
+def version_frame(versions):
+    import pandas as pd
+    return pd.DataFrame(versions, columns=["toolname","version"])
 
-    return version_df
+
+def get_version(force=False):
+    """
+    get_versions as pd.DataFrame with columns toolname and version
+    """
+    return version_frame(get_versions(force))
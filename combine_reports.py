@@ -5,34 +5,114 @@ import numpy as np
 import sys
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from abr_combine.store import combined_tables
+
+output_formats = ["csv", "csv.gz", "parquet"]
 
 parser = argparse.ArgumentParser(description="Combine output of multiple tools")
 
 # input parameters
-parser.add_argument("-i", "--input", dest="input_dir", help="input directory where .xlsx reports are located", required=True)
+parser.add_argument("-i", "--input", dest="input_dir", help="input directory where .xlsx reports are located", default=None)
+parser.add_argument("--store", dest="store", help="read the results from a results store written by run_tools.py --store instead of .xlsx reports", default=None)
+parser.add_argument("--species", dest="species", help="store: only samples of this species", default=None)
+parser.add_argument("--drug", dest="drugs", help="store: only this antibiotic (can be given multiple times)", action="append", default=None)
+parser.add_argument("--since", dest="since", help="store: only samples processed on or after this date (YYYY-MM-DD)", default=None)
+parser.add_argument("--until", dest="until", help="store: only samples processed on or before this date (YYYY-MM-DD)", default=None)
+parser.add_argument("--workers", dest="workers", help="number of processes parsing the .xlsx reports [1]", metavar="INT", type=int, default=1)
+parser.add_argument("--format", dest="format", help="output format, parquet (requires pyarrow) is written with one row per sample [csv]", choices=output_formats, default="csv")
+
+
+class SampleMatrix:
+    """
+    antibiotics of all samples that grows while reports are added. values: 1 True, 0 False, -1 missing
+    """
+
+    def __init__(self, capacity=1024):
+        self.samples = []
+        self.drugs = {}
+        self.values = np.full((capacity, 64), -1, dtype=np.int8)
+
+    def add(self, sample, series):
+        cols = np.array([self.drugs.setdefault(drug, len(self.drugs)) for drug in series.index], dtype=np.int64)
+        rows, ncols = self.values.shape
+        if len(self.samples) == rows or len(self.drugs) > ncols:
+            grown = np.full((rows * 2 if len(self.samples) == rows else rows, max(ncols, 2 * len(self.drugs))), -1, dtype=np.int8)
+            grown[:rows, :ncols] = self.values
+            self.values = grown
+
+        values = series.to_numpy()
+        self.values[len(self.samples), cols] = np.where(pd.isna(values), -1, np.where(values == True, 1, 0))
+        self.samples.append(sample)
+
+    def to_frame(self, keep_false=True):
+        """
+        antibiotics x samples, True where the value is 1, False where it is 0 if keep_false, NaN otherwise
+        """
+        values = self.values[:len(self.samples), :len(self.drugs)].T
+        out = np.full(values.shape, np.nan, dtype=object)
+        out[values == 1] = True
+        if keep_false:
+            out[values == 0] = False
+        return pd.DataFrame(out, index=list(self.drugs.keys()), columns=self.samples)
+
+
+def write_combined(df, name, fmt="csv"):
+    if fmt == "csv":
+        df.to_csv(f"{name}_combined.csv")
+    elif fmt == "csv.gz":
+        df.to_csv(f"{name}_combined.csv.gz", compression="gzip")
+    elif fmt == "parquet":
+        try:
+            import pyarrow
+        except ImportError:
+            sys.stderr.write("parquet output requires pyarrow\n")
+            exit(1)
+        df = df.T
+        df.index.name = "sample"
+        df.columns = [str(c) for c in df.columns]
+        df.astype("boolean").to_parquet(f"{name}_combined.parquet", compression="zstd")
+
+
+def parsed_reports(paths, workers=1):
+    """
+    parse_sheets of all reports in the order of paths, parsed by a pool of workers processes
+    """
+    if workers < 2:
+        yield from map(parse_sheets, paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parse_sheets, paths, chunksize=max(1, min(64, len(paths) // (workers * 4))))
+
 
 def main():
     args = parser.parse_args()
+    if not args.input_dir and not args.store:
+        parser.error("either -i or --store is required")
+
+    if args.store:
+        for k, combined_df in combined_tables(args.store, args.species, args.drugs, args.since, args.until).items():
+            write_combined(combined_df, k, args.format)
+        return
 
+    paths = [os.path.join(args.input_dir, filename) for filename in sorted(os.listdir(args.input_dir)) if filename.endswith(".xlsx")]
     abr_atomic_results = {}
-    for filename in os.listdir(args.input_dir):
-        if filename.endswith(".xlsx"):
-            result = parse_sheets(args.input_dir+"/"+filename)
-            for k in result.keys():
-                if not abr_atomic_results.get(k):
-                    abr_atomic_results[k] = []
-                abr_atomic_results[k].append(result[k])
+    for result in parsed_reports(paths, args.workers):
+        for k, series in result.items():
+            if k not in abr_atomic_results:
+                abr_atomic_results[k] = SampleMatrix()
+            abr_atomic_results[k].add(series.name, series)
 
-    for k in abr_atomic_results.keys():
-        combined_df = pd.concat(abr_atomic_results[k], axis=1)
-        if k != "consensus_prediction":
-            combined_df = combined_df.applymap(lambda x: True if x == True else np.nan)
-        combined_df.to_csv(f"{k}_combined.csv")
+    for k, matrix in abr_atomic_results.items():
+        write_combined(matrix.to_frame(keep_false=(k == "consensus_prediction")), k, args.format)
 
 
 def parse_sheets(input_path):
     results = {}
-    sheets = pd.read_excel(input_path, sheet_name=None, index_col=0)
+    with pd.ExcelFile(input_path) as excel:
+        sheets = {sheet_name: excel.parse(sheet_name, index_col=0) for sheet_name in ["consensus_prediction", "view1_antibiotics"]
+                  if sheet_name in excel.sheet_names}
     for sheet_name, df in sheets.items():
         df.reset_index(inplace=True)
         sample_name=df.columns[0]
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 
 import pandas as pd
-from styleframe import StyleFrame, Styler
 import os
 import sys
 import argparse
 
+from abr_combine.store import combined_view
+
 parser = argparse.ArgumentParser(description="Combine output of multiple tools")
 
 # input parameters
-parser.add_argument("-i", "--input", dest="input_dir", help="input directory where .xlsx reports are located", required=True)
+parser.add_argument("-i", "--input", dest="input_dir", help="input directory where .xlsx reports are located", default=None)
+parser.add_argument("--store", dest="store", help="read view1 from a results store written by run_tools.py --store instead of .xlsx reports", default=None)
+parser.add_argument("--species", dest="species", help="store: only samples of this species", default=None)
+parser.add_argument("--drug", dest="drugs", help="store: only this antibiotic (can be given multiple times)", action="append", default=None)
+parser.add_argument("--since", dest="since", help="store: only samples processed on or after this date (YYYY-MM-DD)", default=None)
+parser.add_argument("--until", dest="until", help="store: only samples processed on or before this date (YYYY-MM-DD)", default=None)
 
 def create_sub(df):
     sample_name = df.columns[0]
@@ -25,20 +31,26 @@ def create_sub(df):
 
 def main():
     args = parser.parse_args()
+    if not args.input_dir and not args.store:
+        parser.error("either -i or --store is required")
+    from styleframe import StyleFrame
 
     collect_style = []
     collect_data = []
 
-    for excelfile in os.listdir(args.input_dir):
-        if not excelfile.endswith(".xlsx"):
-            continue
-        sf = StyleFrame.read_excel(args.input_dir + "/" + excelfile, sheet_name="view1_antibiotics", read_style=True)
-        data = create_sub(sf.data_df)
-        collect_data.append(data)
+    if args.store:
+        df_data = combined_view(args.store, args.species, args.drugs, args.since, args.until)
+    else:
+        for excelfile in os.listdir(args.input_dir):
+            if not excelfile.endswith(".xlsx"):
+                continue
+            sf = StyleFrame.read_excel(args.input_dir + "/" + excelfile, sheet_name="view1_antibiotics", read_style=True)
+            data = create_sub(sf.data_df)
+            collect_data.append(data)
 
-    df_data = pd.concat(collect_data, axis=0)
-    df_data.reset_index(inplace=True)
-    df_data.drop("index", axis=1, inplace=True)
+        df_data = pd.concat(collect_data, axis=0)
+        df_data.reset_index(inplace=True)
+        df_data.drop("index", axis=1, inplace=True)
 
     #style dataframe
     output_df = StyleFrame(df_data)
@@ -3,20 +3,33 @@
 import sys
 import os
 import argparse
-from tempfile import TemporaryDirectory
-import gzip
-import shutil
-
-from abr_combine.util import find_tools, run_tools, EXT_DIR, ROOT_DIR, transl_orgn_resfinder
-from abr_combine.transform import *
-from abr_combine.version import get_version
-from abr_combine.predict import predict_consensus, SEQSPHERE_TEMPLATE_NAMES
+import json
+import csv
+import logging
+
+# only modules without pandas, numpy and GitPython are imported here, the processing modules are imported
+# by main when they are needed. this keeps -h, --version and submit fast (see abr_combine.benchmark startup)
+from abr_combine.util import find_tools, prepare_tools
+from abr_combine.version import get_versions, version_frame
+from abr_combine.cache import default_cache_dir, default_cache_size, default_index_dir
+from abr_combine.fasta import default_fast_tmp, min_shard_size, sample_name
+from abr_combine.genenames import gene_names, default_names_file
+from abr_combine.registry import registry, default_registry_file
+from abr_combine.metrics import Metrics, write_prometheus
+from abr_combine.service import submit, job_status, default_host, default_port
 
 parser = argparse.ArgumentParser(description="Create a consensus prediction from multiple resistance detection tools")
 
+# run mode
+parser.add_argument("mode", nargs="?", choices=["run", "serve", "submit", "rescore"], default="run",
+                    help="run: process -i or --batch [default], serve: keep tools and databases loaded and process jobs submitted over HTTP or a UNIX socket, submit: send -i to a running service, "
+                         "rescore: recompute views and consensus predictions of the intermediates in directory -i with the current cutoffs and weights")
+
 # input parameters
-parser.add_argument("-i", "--input", dest="input_fasta", help="input nucleotide fasta file (i.e. genome, contigs)")
+parser.add_argument("-i", "--input", dest="input_fasta", help="input nucleotide fasta file (i.e. genome, contigs), may be compressed (gzip, bgzip, bz2, zstd) or a tar archive of fasta files")
 parser.add_argument("-s", "--species", dest="species", help="species name", default="")
+parser.add_argument("--batch", dest="batch", help="sample sheet (tab-separated: sample, fasta[, species]) or directory of fasta files to process in one run", default=None)
+parser.add_argument("--samples", dest="samples", help="number of samples processed in parallel in batch, serve and rescore mode [1]", metavar="INT", type=int, default=1)
 
 # tool selection
 parser.add_argument("--auto", dest="auto", help="Auto-detect tools and use all available [default]", action="store_true", default=False)
@@ -31,16 +44,89 @@ parser.add_argument("--resfinder_result", dest="resfinder_result", help="Pre-cal
 
 # output options
 parser.add_argument("--tmp", dest="tmpdir", help="prefix for temporary file storage [/tmp]", default="/tmp")
-parser.add_argument("-o", dest="outtable", help="prefix to write output tables [STDOUT]", default=None)
+parser.add_argument("--fast_tmp", dest="fast_tmp", help=f"memory backed directory (tmpfs) to decompress input into, falls back to --tmp if not usable [{default_fast_tmp}]", default=default_fast_tmp)
+parser.add_argument("-o", dest="outtable", help="prefix to write output tables, output directory in batch, serve and submit mode (submit: below the -o of the service) [STDOUT]", default=None)
 parser.add_argument("-v", "--version", dest="version", help="Print versions and exits", action="store_true", default=False)
-parser.add_argument("--xls", dest="excelfile", help="write all possible output into one excel file", default=None)
-parser.add_argument("--spec", dest="specfile", help="write resistances into .spec file for SeqSphere import", default=None)
-parser.add_argument("--label", dest="label", help="add tag or sample name to specific output sheets", default=None)
-parser.add_argument("--threads", dest="threads", help="number of parallel threads to use [1]", metavar="INT", type=int, default=1)
+parser.add_argument("--xls", dest="excelfile", help="write all possible output into one excel file, output directory in batch, serve and submit mode", default=None)
+parser.add_argument("--spec", dest="specfile", help="write resistances into .spec file for SeqSphere import, output directory in batch, serve and submit mode", default=None)
+parser.add_argument("--json", dest="jsonfile", help="write consensus prediction, tool calls per antibiotic and gene and versions as json, output directory in batch mode", default=None)
+parser.add_argument("--ndjson", dest="ndjsonfile", help="append the json record of each sample as one line to this file", default=None)
+parser.add_argument("--label", dest="label", help="add tag or sample name to specific output sheets, defaults to the sample name in batch mode", default=None)
+parser.add_argument("--threads", dest="threads", help="number of parallel threads to use, shared by the tools running in parallel (per sample in batch mode) [1]", metavar="INT", type=int, default=1)
+parser.add_argument("--shards", dest="shards", help="split large inputs (metagenomes) into up to INT contig shards that AMRFinder processes in parallel, "
+                    f"shards have at least {min_shard_size} bases, RGI and ResFinder always run on the complete input [1]", metavar="INT", type=int, default=1)
+parser.add_argument("--prescreen", dest="prescreen", help="on: run the tools only on contigs sharing k-mers with the ResFinder and PointFinder databases, "
+                    "check: run the tools on the complete and the prescreened input and report the hits lost by the prescreen", choices=["on", "check"], default=None)
+parser.add_argument("--prescreen_index", dest="prescreen_index", help=f"directory of the prescreen k-mer index, rebuilt when the databases change [{default_index_dir}]",
+                    default=default_index_dir)
+parser.add_argument("--cache", dest="cachedir", help=f"directory of the tool result cache [{default_cache_dir}]", default=default_cache_dir)
+parser.add_argument("--cache_size", dest="cache_size", help=f"maximum size of the tool result cache in MB, least recently used results are removed [{default_cache_size}]", metavar="MB", type=int, default=default_cache_size)
+parser.add_argument("--gene_names", dest="names_file", help=f"persistent gene name dictionary shared by all runs [{default_names_file}]", default=default_names_file)
+parser.add_argument("--tool_registry", dest="registry_file", help=f"cache of tool locations, versions and supported organisms, updated when the executables change [{default_registry_file}]", default=default_registry_file)
+parser.add_argument("--no-cache", dest="no_cache", help="do not reuse or store tool results, gene names, tool probing results and the prescreen index in the caches", action="store_true", default=False)
+parser.add_argument("--intermediate", dest="intermediate", help="store tool tables and the merged table for rescoring in this file, directory in batch and serve mode", default=None)
+parser.add_argument("--store", dest="store", help="append consensus prediction, view1 and raw hits to this sqlite results store, read by combine_reports.py --store", default=None)
+parser.add_argument("--force", dest="force", help="rescore: process all samples, not only the ones that changed since the last rescore into -o", action="store_true", default=False)
+parser.add_argument("--timeout", dest="timeout", help="maximum runtime of each tool (of each shard run with --shards) in seconds, measured from its start, all tools of a sample start together [no limit]", metavar="SEC", type=float, default=None)
+parser.add_argument("--metrics", dest="metrics", help="write wall time, cpu time and memory (rss of the stages, peak rss of the tools) of all stages and tools to <-o>.metrics.json (per sample in batch mode) [STDERR]", action="store_true", default=False)
+parser.add_argument("--debug", dest="debug", help="log parsing details of the tool outputs (PointFinder genes, table columns) to STDERR", action="store_true", default=False)
+
+# service options
+parser.add_argument("--host", dest="host", help=f"address of the service [{default_host}]", default=default_host)
+parser.add_argument("--port", dest="port", help=f"port of the service [{default_port}]", type=int, default=default_port)
+parser.add_argument("--socket", dest="socket", help="UNIX socket of the service, used instead of host and port", default=None)
+parser.add_argument("--upload", dest="upload", help="submit: send the fasta content instead of its path, for services without access to the file", action="store_true", default=False)
+parser.add_argument("--wait", dest="wait", help="submit: wait for the job to finish, exit code is the exit code of the job", action="store_true", default=False)
+parser.add_argument("--job", dest="job", help="submit: print the status of a submitted job instead of submitting", default=None)
+parser.add_argument("--prometheus", dest="prometheus", help="write stage and tool metrics to a node exporter textfile", metavar="FILE", default=None)
+
+
+def submit_job(args):
+    connection = {"host": args.host, "port": args.port, "socket_path": args.socket}
+    if args.job:
+        job = job_status(args.job, **connection)
+        if job is None:
+            sys.stderr.write(f"Job not found: {args.job}\n")
+            return 1
+    else:
+        if not args.input_fasta:
+            parser.error("submit requires an input fasta (-i)")
+        options = {"label": args.label, "outtable": args.outtable, "excelfile": args.excelfile, "specfile": args.specfile, "metrics": args.metrics}
+        try:
+            job = submit(args.input_fasta, args.species, args.label, options, args.upload, args.wait, **connection)
+        except (ValueError, OSError) as e:
+            sys.stderr.write(f"Submission failed: {e}\n")
+            return 1
+    json.dump(job, sys.stdout, indent=1)
+    sys.stdout.write("\n")
+    if job["status"] in ["done", "failed"]:
+        return job["exit_code"]
+    return 0
 
 
 def main():
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG if args.debug else logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    if args.mode == "submit":
+        exit(submit_job(args))
+    if args.mode in ["serve", "rescore"] and not args.outtable:
+        parser.error(f"{args.mode} requires an output directory (-o)")
+    if args.mode == "rescore":
+        if not args.input_fasta or not os.path.isdir(args.input_fasta):
+            parser.error("rescore requires the directory of intermediates (-i)")
+        from abr_combine.rescore import rescore_archive
+        status = rescore_archive(args.input_fasta, args.outtable, args.samples, args.force, args.excelfile, args.specfile)
+        failed = [sample for sample, s in status.items() if s == "failed"]
+        sys.stdout.write(f"Rescored {list(status.values()).count('rescored')} samples, {len(failed)} failed\n")
+        exit(1 if failed else 0)
+    if args.input_fasta and args.batch:
+        parser.error("-i and --batch can not be combined")
+    if args.batch and not args.outtable:
+        parser.error("batch mode requires an output directory (-o)")
+
+    registry_file = None if args.no_cache else args.registry_file
+    if registry_file:
+        registry.load(registry_file)
 
     # detecting tools to be used:
     methods = []
@@ -60,133 +146,74 @@ def main():
             if nf == s:
                 methods.remove(s)
 
-    version_df = get_version(force=False)
+    prepare_tools(methods)
+
+    cachedir = None if args.no_cache else args.cachedir
+    names_file = None if args.no_cache else args.names_file
+    prescreen_index = None if args.no_cache else args.prescreen_index
+    if names_file:
+        gene_names.load(names_file)
+
+    versions = get_versions(force=False)
+    if registry_file:
+        registry.save(registry_file)
     if args.version:
-        version_df.to_csv(sys.stdout, sep=":", header=None, index=None)
+        csv.writer(sys.stdout, delimiter=":", lineterminator="\n").writerows(versions)
         exit(0)
 
-    with TemporaryDirectory(dir=args.tmpdir) as tmpdir:
-        if args.input_fasta.endswith(".gz"):
-            input_fasta = f"{tmpdir}/input_file.fasta" 
-            with open(input_fasta, "wb") as inf_h:
-                with gzip.open(args.input_fasta, "rb") as gzip_h:
-                    shutil.copyfileobj(gzip_h, inf_h)
+    from abr_combine.pipeline import process_sample
+    from abr_combine.phenotypes import read_phenotypes, db_version
+    from abr_combine.batch import collect_samples, run_batch
+    version_df = version_frame(versions)
+
+    options = {"tmpdir": args.tmpdir, "fast_tmp": args.fast_tmp, "threads": args.threads, "timeout": args.timeout, "label": args.label,
+               "outtable": args.outtable, "excelfile": args.excelfile, "specfile": args.specfile,
+               "cachedir": cachedir, "cache_size": args.cache_size, "names_file": names_file, "registry_file": registry_file, "metrics": args.metrics,
+               "intermediate": args.intermediate, "store": args.store, "shards": args.shards, "jsonfile": args.jsonfile, "ndjsonfile": args.ndjsonfile,
+               "prescreen": args.prescreen, "prescreen_index": prescreen_index}
+    if args.mode == "serve":
+        from abr_combine.service import serve
+        exit(serve(methods, version_df, options, args.outtable, args.samples, args.host, args.port, args.socket))
+
+    if args.batch:
+        samples = collect_samples(args.batch, args.species)
+        sample_metrics = {}
+        exit_codes = run_batch(samples, methods, version_df, options, args.samples, sample_metrics)
+        failed = [sample for sample, code in exit_codes.items() if code != 0]
+        sys.stdout.write(f"Processed {len(exit_codes)} samples, {len(failed)} failed\n")
+        if args.prometheus:
+            species = {sample: s for sample, fasta, s in samples}
+            write_prometheus(args.prometheus, [({"species": species[sample]}, m) for sample, m in sample_metrics.items()])
+        exit(1 if failed else 0)
+
+    if args.amrfinder_result:
+        outputfiles["NCBIAMRFinder"] = args.amrfinder_result
+    if args.rgi_result:
+        outputfiles["CARD-RGI"] = args.rgi_result
+    if args.resfinder_result:
+        outputfiles["ResFinder"] = args.resfinder_result
+
+    metrics = Metrics()
+    with metrics.stage("phenotype_load"):
+        df_pheno = read_phenotypes(args.species, db_version(version_df))
+    exit_code = process_sample(args.input_fasta, args.species, methods, outputfiles, df_pheno, version_df, args.tmpdir, args.threads, args.timeout,
+                               args.outtable, args.excelfile, args.specfile, args.label, cachedir, args.cache_size, args.fast_tmp, metrics,
+                               args.intermediate, args.label or sample_name(args.input_fasta or ""), args.store, args.shards,
+                               args.prescreen, prescreen_index, args.jsonfile, args.ndjsonfile)
+    if names_file:
+        gene_names.save(names_file)
+    stats = gene_names.stats()
+    sys.stderr.write(f"Gene name cache: {stats['hits']} hits, {stats['misses']} misses\n")
+    if args.metrics:
+        if args.outtable:
+            metrics.write_json(args.outtable + ".metrics.json", sample=args.label, species=args.species, exit_code=exit_code)
         else:
-            input_fasta = args.input_fasta
-
-        # run tools and update output to methods that did not fail
-        methods = run_tools(methods, input_fasta, args.species, tmpdir, args.threads)
-        if args.amrfinder_result:
-            methods.append("NCBIAMRFinder")
-            outputfiles["NCBIAMRFinder"] = args.amrfinder_result
-        if args.rgi_result:
-            methods.append("CARD-RGI")
-            outputfiles["CARD-RGI"] = args.rgi_result
-        if args.resfinder_result:
-            methods.append("ResFinder")
-            outputfiles["ResFinder"] = args.resfinder_result
-
-        # read files for each successful method and store df output
-        dfs = []
-        for tool in methods:
-            for output_file in [outputfiles.get(tool, f"{tmpdir}/{tool}"),f"{tmpdir}/{tool}.txt"]:
-                if os.path.exists(output_file):
-                    try:
-                        dfs.append(read_amr(output_file, tool))
-                    except pd.errors.EmptyDataError:
-                        sys.stderr.write(f"{output_file} is empty\n")
-                        methods.remove(tool)
-                
-
-    if len(dfs) == 0:
-        print("ERROR: no tool executable or no output available")
-        exit(1)
-
-    df = combine_tables(dfs, on="mo")
-
-    methods.append("phenotype")
-    phenofile = os.path.join(EXT_DIR, "db_resfinder", "phenotypes.txt")
-    df_pheno = read_table(phenofile, "phenotype", "\t", ",", "Phenotype", "Gene_accession no.", report=["Class"])
-    df_pheno.drop_duplicates("mo", inplace=True)
-
-    pointfinder_species = transl_orgn_resfinder("" ,args.species)
-    if pointfinder_species:
-        # TODO rewrite to function
-        point_pheno_file = os.path.join(EXT_DIR, "db_pointfinder", pointfinder_species.replace(" ","_") ,"resistens-overview.txt")
-        df_point_pheno = pd.read_csv(point_pheno_file, sep="\t", header=None, names=["Gene_ID","Gene_name","Codon_pos","Ref_nuc","Ref_codon","Res_codon","Resistance","PMID","Mechanism","Notes","Required_mut"], comment="#")
-
-        # expanding multiple possible Res_codons to multiple rows
-        s = df_point_pheno.apply(lambda row: pd.Series(row["Res_codon"].split(",")), axis=1).stack().reset_index(level=1, drop=True)
-        s.name = 'Res_codon'
-        df_point_pheno = df_point_pheno.drop("Res_codon", axis=1).join(s)
-
-        # create mergeable resistance gene code
-        pos = df_point_pheno["Ref_codon"] + df_point_pheno["Codon_pos"].astype(int).astype(str) + df_point_pheno["Res_codon"]
-        df_point_pheno["phenotype"] = df_point_pheno["Gene_name"] + "_" + pos
-
-        # create mergeable df structure
-        df_point_pheno["antibiotic_phenotype"] = df_point_pheno["Resistance"]
-        df_point_pheno["mo"] = df_point_pheno["Gene_name"].str.lower() + "_" + pos.str.lower()
-        df_point_pheno = df_point_pheno[['antibiotic_phenotype', 'phenotype', 'mo']].drop_duplicates(subset="mo")
-        
-        # append pointfinder phenotype to resfinder phenotypes (antibiotics naming for resistance genes)
-        df_pheno = pd.concat([df_pheno, df_point_pheno])
-
-    df = df.merge(df_pheno, on="mo", how="left", suffixes=["_o",""])
-    df.drop("phenotype", axis=1, inplace=True)
-    
-
-    view1 = view_by_antibiotic(df, methods)
-    view2 = view_by_genes(df, methods)
-
-    if args.label:
-        view1.index.name = args.label
-        view2.index.name = args.label
-
-    if not args.outtable:
-        write_table(view1, sys.stdout)
-        write_table(view2, sys.stdout)
-    else:
-        write_table(view1, args.outtable +".view1.csv")
-        write_table(view2, args.outtable +".view2.csv")
-
-    consensus_df = predict_consensus(view1)
-
-    if args.excelfile:
-        writer = pd.ExcelWriter(args.excelfile, engine='openpyxl')
-
-        #if args.label:
-        #    consensus_df.rename(columns={"Above resistance cutoff": args.label}, inplace=True)
-        consensus_df.to_excel(writer, 'consensus_prediction')
-        view1 = color_table(view1)
-        view1.to_excel(writer, 'view1_antibiotics')
-        view2 = color_table(view2)
-        view2.to_excel(writer, 'view2_genes')
-        #version_df = pd.read_csv(f"{ROOT_DIR}/versions.csv", sep="\t", names=["Tool", "Version"])
-        for m, d in zip(methods, dfs):
-            d = color_table(d)
-            if args.label:
-                d.index.name = args.label
-            d.to_excel(writer, f"raw_{m}")
-
-        version_df.to_excel(writer, "versions")
-        writer.save()
-
-    if args.specfile:
-        versions = {row["toolname"]: row["version"] for i, row in version_df.iterrows()}
-        drugs = consensus_df[consensus_df["Above resistance cutoff"]].index
-        print(drugs)
-        with open(args.specfile, "w") as outf_h:
-            for drug in drugs:
-                outf_h.write(f"ef.Antimicrobial.{drug.replace('+', '_').replace(' ', '_').lower()}=Resistant\n")
-            for m in methods:
-                version_tag = SEQSPHERE_TEMPLATE_NAMES.get(m)
-                if version_tag:
-                    outf_h.write(f"ef.Antimicrobial.{version_tag}={versions[m]}\n")
-            outf_h.write(f"ef.Antimicrobial.script_version={versions['Main']}\n")
-            
+            json.dump(dict(metrics.to_dict(), sample=args.label, species=args.species, exit_code=exit_code), sys.stderr, indent=1)
+            sys.stderr.write("\n")
+    if args.prometheus:
+        write_prometheus(args.prometheus, [({"species": args.species}, metrics.to_dict())])
+    exit(exit_code)
 
 
 if __name__ == '__main__':
     main()
-
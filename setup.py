@@ -1,9 +1,11 @@
 from setuptools import setup, find_packages
 import os
 from abr_combine.version import get_version
+from abr_combine.phenotypes import build_index, db_version
 
 version_df = get_version(force=True)
 version_df.to_csv("abr_combine/versions.csv", sep="\t", header=None, index=None)
+build_index(db_version(version_df))
 
 files_resfinder = []
 for dbfile in os.listdir("ext/db_resfinder"):
@@ -11,7 +13,7 @@ for dbfile in os.listdir("ext/db_resfinder"):
         files_resfinder.append(f"ext/db_resfinder/{dbfile}")
 
 data_files = [("ext/db_resfinder", files_resfinder),
-              ("abr_combine", ["abr_combine/versions.csv"])]
+              ("abr_combine", ["abr_combine/versions.csv", "abr_combine/phenotypes.idx"])]
 
 files_pointfinder = []
 for dbfile in os.listdir("ext/db_pointfinder"):